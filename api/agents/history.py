@@ -0,0 +1,101 @@
+from os import getenv
+from langchain_ollama import ChatOllama
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from prompts import CONVERSATION_SUMMARY_PROMPT
+
+
+OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
+SUMMARY_MODEL = getenv("SUMMARY_MODEL", getenv("PROFESSOR_MODEL"))
+# Turns (a student message and everything answering it) sent verbatim
+HISTORY_TURNS = int(getenv("HISTORY_TURNS", "6"))
+# Older turns are folded into the summary this many at a time, so the
+# summary model runs once every HISTORY_FOLD_TURNS turns instead of on each
+HISTORY_FOLD_TURNS = int(getenv("HISTORY_FOLD_TURNS", "4"))
+
+
+def turn_starts(messages):
+    """Indexes of the HumanMessages that start each turn"""
+    return [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+
+def fold_boundary(messages, summarized, turns=HISTORY_TURNS, fold_turns=HISTORY_FOLD_TURNS):
+    """Index up to which messages should be folded into the summary, or None
+    while fewer than turns + fold_turns turns follow `summarized`. Both are
+    at least 1: the current turn, with the student's question, is never
+    folded, and a fold always has a turn to summarize."""
+    turns, fold_turns = max(turns, 1), max(fold_turns, 1)
+    starts = [index for index in turn_starts(messages) if index >= summarized]
+    if len(starts) < turns + fold_turns:
+        return None
+    return starts[-turns]
+
+
+def transcript(messages):
+    """Conversation text for the summary model: what the student and the
+    professor said, without tool payloads"""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Student: {message.content}")
+        elif isinstance(message, AIMessage):
+            if message.content:
+                lines.append(f"Professor: {message.content}")
+            for tool_call in message.tool_calls:
+                lines.append(f"(Professor used {tool_call['name']} with {tool_call['args']})")
+    return "\n\n".join(lines)
+
+
+def strip_stale_tool_payloads(messages):
+    """Copy of `messages` where tool outputs of earlier turns are replaced by
+    a placeholder. Outputs of the current turn, from its last HumanMessage
+    on, are kept; the checkpointed messages are not modified."""
+    starts = turn_starts(messages)
+    current = starts[-1] if starts else 0
+    return [
+        message.model_copy(update={"content": f"[{message.name} output from an earlier turn omitted]"})
+        if isinstance(message, ToolMessage) and index < current
+        else message
+        for index, message in enumerate(messages)
+    ]
+
+
+def history_messages(state):
+    """The conversation the model sees: the running summary, if any, then
+    the turns not folded into it with stale tool outputs stripped"""
+    messages = [message for message in state["messages"] if not isinstance(message, SystemMessage)]
+    recent = strip_stale_tool_payloads(messages[state.get("summarized_messages", 0):])
+    if summary := state.get("summary"):
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + recent
+    return recent
+
+
+class HistoryManager:
+    """Graph node that keeps the prompt bounded on long threads.
+
+    Once HISTORY_TURNS + HISTORY_FOLD_TURNS turns are unsummarized,
+    every turn but the last HISTORY_TURNS is folded into `summary`, and
+    `summarized_messages` moves past them. Both live in the checkpoint,
+    so each fold only summarizes the new turns; the messages themselves stay
+    in the thread for /conversation.
+    """
+
+    def __init__(self, turns=HISTORY_TURNS, fold_turns=HISTORY_FOLD_TURNS) -> None:
+        self.turns = turns
+        self.fold_turns = fold_turns
+        # "nostream" keeps summary tokens out of the graph's messages stream,
+        # which ainvoke_graph forwards to the student
+        self.model = ChatOllama(model=SUMMARY_MODEL, base_url=OLLAMA_BASE_URL, reasoning=False).with_config(tags=["nostream"])
+
+    async def __call__(self, state):
+        messages = [message for message in state["messages"] if not isinstance(message, SystemMessage)]
+        summarized = state.get("summarized_messages", 0)
+        boundary = fold_boundary(messages, summarized, self.turns, self.fold_turns)
+        if boundary is None:
+            return {}
+
+        response = await self.model.ainvoke([
+            SystemMessage(content=CONVERSATION_SUMMARY_PROMPT),
+            HumanMessage(content=f"Current summary:\n{state.get('summary') or '(empty)'}\n\nConversation:\n{transcript(messages[summarized:boundary])}")
+        ])
+        print(f"Folded {boundary - summarized} messages into the conversation summary")
+        return {"summary": response.content, "summarized_messages": boundary}
@@ -1,59 +1,165 @@
 from os import getenv
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 import asyncio
 import json
+import time
 from langchain_ollama import ChatOllama
-from langgraph.checkpoint.postgres import PostgresSaver
+from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.graph.message import add_messages
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.prebuilt import tools_condition
 from prompts import MAIN_MODEL_PROMPT
-from data_processing import VectorStore
+from connection_pools import get_async_checkpoint_pool
+from typing import Annotated
 from typing_extensions import TypedDict
-from toolbox import generate_study_questions, search_documents
+from toolbox import SEARCH_DOCUMENTS_TOP_K, generate_study_questions, search_documents
+from speculative_retrieval import get_speculative_retrieval
+from agents.history import HistoryManager, history_messages
+from agents.tool_memo import TOOL_MEMO_SIZE, memo_key, merge_tool_memo
+from data_processing import get_async_vector_store
 
 
 OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
 POSTGRES_URL = getenv("POSTGRES_URL")
 MONGO_URL = getenv("MONGO_URL")
 PROFESSOR_MODEL = getenv("PROFESSOR_MODEL")
+# Seconds a tool call may take before the model gets a timeout error instead
+TOOL_TIMEOUT = float(getenv("TOOL_TIMEOUT", "60"))
+# Per-tool overrides, "name=seconds,name=seconds"
+TOOL_TIMEOUTS = {
+    name.strip(): float(seconds)
+    for name, seconds in (item.split("=") for item in getenv("TOOL_TIMEOUTS", "").split(",") if item.strip())
+}
+# Threads running tools that only have a sync implementation
+TOOL_WORKERS = int(getenv("TOOL_WORKERS", "4"))
 
 class State(TypedDict):
-    messages: list
+    # Nodes return only their new messages; add_messages appends them, so a
+    # step writes its own messages to the checkpoint, not the whole thread
+    messages: Annotated[list, add_messages]
     context: str
+    # Running summary of the turns before messages[summarized_messages],
+    # maintained by HistoryManager
+    summary: str
+    summarized_messages: int
+    # Results of earlier tool calls in this thread, see ToolNode
+    tool_memo: Annotated[dict, merge_tool_memo]
 
 
 class ToolNode:
-    def __init__(self, tools: list) -> None:
+    """Runs the tool calls of the last AI message concurrently.
+
+    Tools with a coroutine run on the event loop and the others on a
+    bounded thread pool, all awaited together; results keep the order of the
+    tool calls. A call that fails or exceeds its timeout becomes an error
+    ToolMessage for the model rather than failing the run. A sync tool that
+    times out keeps its thread until it returns.
+
+    Results of `memoized` tools are stored in the thread's tool_memo, keyed
+    by tool name and normalized arguments and tagged with the corpus
+    version; a later call in the thread with equivalent arguments is
+    answered from the memo while no documents have been ingested or
+    deleted since.
+    """
+
+    def __init__(self, tools: list, timeouts=None, default_timeout=TOOL_TIMEOUT, workers=TOOL_WORKERS, memoized=()) -> None:
         self.tools_by_name = {tool.name: tool for tool in tools}
-
-
-    def __call__(self, state: State):
+        self.memoized = set(memoized) if TOOL_MEMO_SIZE > 0 else set()
+        self.timeouts = {**TOOL_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = default_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+        # name -> calls, memo_hits, errors, timeouts, total_ms, max_ms
+        self.timings = {}
+
+    async def __call__(self, state: State, config: RunnableConfig):
         if messages := state.get("messages", []):
             message = messages[-1]
         else:
             raise ValueError("No message found in input")
-        outputs = []
-        for tool_call in message.tool_calls:
-            tool_result = self.tools_by_name[tool_call["name"]].invoke(
-                tool_call["args"]
-            )
-            outputs.append(
-                ToolMessage(
-                    content=tool_result,
-                    name=tool_call["name"],
-                    tool_call_id=tool_call["id"],
-                )
-            )
 
-        state["messages"] = state["messages"] + outputs
+        memo = state.get("tool_memo") or {}
+        corpus_version = None
+        if any(tool_call["name"] in self.memoized for tool_call in message.tool_calls):
+            try:
+                corpus_version = await get_async_vector_store().corpus_version()
+            except Exception as error:
+                # Without a version the memo can be neither trusted nor filled
+                print(f"Tool memo disabled for this step: {error!r}")
+
+        outputs = await asyncio.gather(*(
+            self.run_tool_call(tool_call, config, memo, corpus_version) for tool_call in message.tool_calls
+        ))
+        messages = [output for output, _ in outputs]
+        memo_updates = dict(update for _, update in outputs if update)
+        if memo_updates:
+            return {"messages": messages, "tool_memo": memo_updates}
+        return {"messages": messages}
+
+    async def run_tool_call(self, tool_call, config, memo, corpus_version):
+        """(ToolMessage, (memo key, memo entry) to store or None)"""
+        name = tool_call["name"]
+        key = memo_key(name, tool_call["args"]) if name in self.memoized and corpus_version is not None else None
+        entry = memo.get(key)
+        if entry and entry["corpus_version"] == corpus_version:
+            self.record(name, "memo", 0.0)
+            print(f"[Tool] {name} served from the thread's tool memo")
+            return ToolMessage(content=entry["content"], name=name, tool_call_id=tool_call["id"]), None
+
+        tool = self.tools_by_name[name]
+        timeout = self.timeouts.get(name, self.default_timeout)
+        if getattr(tool, "coroutine", None) is not None:
+            pending = tool.ainvoke(tool_call["args"], config)
+        else:
+            # Context is copied so callbacks and tracing follow the call
+            pending = asyncio.get_running_loop().run_in_executor(
+                self.executor, copy_context().run, tool.invoke, tool_call["args"], config
+            )
 
-        return state
+        start = time.perf_counter()
+        status = "success"
+        try:
+            content = await asyncio.wait_for(pending, timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            content = f"Error: {name} did not finish within {timeout:g}s"
+        except Exception as error:
+            status = "error"
+            content = f"Error: {name} failed: {error!r}"
+        elapsed = (time.perf_counter() - start) * 1000
+        self.record(name, status, elapsed)
+        print(f"[Tool] {name} {status} in {elapsed:.0f}ms")
+
+        update = None
+        if key and status == "success" and isinstance(content, str):
+            update = (key, {"content": content, "corpus_version": corpus_version})
+        return ToolMessage(
+            content=content,
+            name=name,
+            tool_call_id=tool_call["id"],
+            status="success" if status == "success" else "error",
+        ), update
+
+    def record(self, name, status, elapsed):
+        timing = self.timings.setdefault(name, {"calls": 0, "memo_hits": 0, "errors": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0})
+        timing["calls"] += 1
+        timing["memo_hits"] += status == "memo"
+        timing["errors"] += status == "error"
+        timing["timeouts"] += status == "timeout"
+        timing["total_ms"] += elapsed
+        timing["max_ms"] = max(timing["max_ms"], elapsed)
+
+    def stats(self):
+        """Per-tool call counts and latencies"""
+        return {
+            name: {**timing, "mean_ms": timing["total_ms"] / timing["calls"]}
+            for name, timing in list(self.timings.items())
+        }
 
 class ProfessorAgent:
     def __init__(self) -> None:
-        self.search_engine = VectorStore()
-        
         tools = [generate_study_questions, search_documents]
         self.reasoning = None
         if PROFESSOR_MODEL == "qwen3:8b":
@@ -67,57 +173,42 @@ class ProfessorAgent:
 
         self.graph_builder = StateGraph(State)
 
-        tools_node = ToolNode(tools)
+        self.tools_node = ToolNode(tools, memoized={"search_documents", "generate_study_questions"})
 
-        self.graph_builder.add_node("inject_prompt", self.inject_prompt)
+        self.graph_builder.add_node("manage_history", HistoryManager())
         self.graph_builder.add_node("chatbot", self.chatbot)
-        self.graph_builder.add_node("tools", tools_node)
+        self.graph_builder.add_node("tools", self.tools_node)
 
-        self.graph_builder.add_edge(START, "inject_prompt")
-        self.graph_builder.add_edge("inject_prompt", "chatbot")
+        self.graph_builder.add_edge(START, "manage_history")
+        self.graph_builder.add_edge("manage_history", "chatbot")
 
         self.graph_builder.add_conditional_edges("chatbot", tools_condition)
         self.graph_builder.add_edge("tools", "chatbot")
 
+        # Compiled once and shared by every request; the checkpointer only
+        # borrows pooled connections per operation, so concurrent threads
+        # can run on the same graph
+        self.graph = self.graph_builder.compile(checkpointer=ProfessorAgent.checkpointer())
+
     @staticmethod
     def checkpointer():
-        return PostgresSaver.from_conn_string(POSTGRES_URL)
-
-    def inject_prompt(self, state: State):
-        messages = state.get("messages", [])
-
-        if not any(isinstance(msg, SystemMessage) for msg in messages):
-            system_prompt = SystemMessage(
-                content=MAIN_MODEL_PROMPT
-            )
-            messages.insert(0, system_prompt)
-
-        state["messages"] = messages
-
-        return state
-
-    def retrieve_context(self, state: State):
-        documents = self.search_engine.search(state["messages"][-1].content)
-        context = "\n\n".join([entry["text"] for entry in documents])
-
-        state["context"] = context
-        return state
-
-    def chatbot(self, state: State):
-        last_message = state["messages"][-1]
-
-        if isinstance(last_message, HumanMessage):
-            # context = state["context"]
-            query = last_message.content
-            prompt = query
-
-            llm_response = self.model.invoke(state["messages"][:-1] + [HumanMessage(content=prompt)])
-            state["messages"].append(llm_response)
-        else:
-            llm_response = self.model.invoke(state["messages"])
-            state["messages"].append(llm_response)
-
-        return state
+        """Checkpointer borrowing connections from the shared async checkpoint
+        pool. Must be created on the event loop the pool was opened on."""
+        return AsyncPostgresSaver(get_async_checkpoint_pool())
+
+    def prompt_messages(self, state: State):
+        """The system prompt followed by the conversation as windowed by
+        history_messages. The prompt is added at call time and never
+        stored; one stored by older threads (see
+        scripts/migrate_checkpoint_messages.py) is skipped."""
+        return [SystemMessage(content=MAIN_MODEL_PROMPT)] + history_messages(state)
+
+    async def chatbot(self, state: State):
+        # ainvoke streams tokens from the async Ollama client; under astream
+        # (stream_mode="messages") each one is forwarded as it arrives
+        llm_response = await self.model.ainvoke(self.prompt_messages(state))
+
+        return {"messages": [llm_response]}
     
     def inject_context(self, state: State):
         last_message = state["messages"][-1]
@@ -134,21 +225,24 @@ class ProfessorAgent:
             }]}
     
     async def ainvoke_graph(self, query, thread_id):
-        with ProfessorAgent.checkpointer() as checkpointer:
-            agent = self.graph_builder.compile(checkpointer=checkpointer)
-            config = {"configurable": {"thread_id": thread_id}}
-            messages = [HumanMessage(content=query)]
-
-            if previous_messages := agent.get_state(config)[0].get("messages"):
-                messages = previous_messages + messages
-
-            response_stream = agent.stream(
-                {"messages": messages},
-                config=config,
-                stream_mode="messages"
-            )
-
-            for chunk in response_stream:
+        config = {"configurable": {"thread_id": thread_id}}
+
+        # With SPECULATIVE_RETRIEVAL the question is searched while the model
+        # generates its first response; search_documents reuses the result
+        prefetcher = get_speculative_retrieval()
+        if prefetcher:
+            prefetcher.start(thread_id, query, SEARCH_DOCUMENTS_TOP_K)
+
+        # Only the new message is sent; the checkpointed history is loaded
+        # by the graph and the reducer appends to it
+        response_stream = self.graph.astream(
+            {"messages": [HumanMessage(content=query)]},
+            config=config,
+            stream_mode="messages"
+        )
+
+        try:
+            async for chunk in response_stream:
                 message = chunk[0]
                 if isinstance(message, AIMessageChunk):
                     json_message = {
@@ -156,11 +250,11 @@ class ProfessorAgent:
                         "additional_kwargs": message.additional_kwargs
                     }
                     yield f"data: {json.dumps(json_message)}\n\n"
-                    await asyncio.sleep(0)
                 else:
                     print(f"Unknown object in stream: {type(message)}")
+        finally:
+            if prefetcher:
+                prefetcher.finish(thread_id)
 
-    def get_conversation(self, config):
-        with ProfessorAgent.checkpointer() as checkpointer:
-            graph = self.graph_builder.compile(checkpointer=checkpointer)
-            return graph.get_state(config)
\ No newline at end of file
+    async def get_conversation(self, config):
+        return await self.graph.aget_state(config)
\ No newline at end of file
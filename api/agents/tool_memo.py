@@ -0,0 +1,46 @@
+from os import getenv
+import json
+import re
+import unicodedata
+
+
+# Tool results remembered per conversation thread
+TOOL_MEMO_SIZE = int(getenv("TOOL_MEMO_SIZE", "32"))
+
+
+def normalize_argument(value):
+    """Case, accents, spacing and trailing punctuation do not change what a
+    tool is asked for: "Escalonamento de processos?" and "escalonamento de
+    processos" share a memo entry"""
+    if isinstance(value, str):
+        text = unicodedata.normalize("NFKD", value.casefold())
+        text = "".join(character for character in text if not unicodedata.combining(character))
+        return re.sub(r"\s+", " ", text).strip(" .?!;:,")
+    if isinstance(value, dict):
+        return {key: normalize_argument(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize_argument(item) for item in value]
+    return value
+
+
+def memo_key(name, args):
+    return f"{name}:{json.dumps(normalize_argument(args), sort_keys=True, ensure_ascii=False)}"
+
+
+def merge_tool_memo(current, update):
+    """Reducer of the tool_memo state channel.
+
+    Entries are {"content", "corpus_version"} by memo_key. Entries recorded
+    under another corpus version than the update's are dropped, as the
+    documents changed since, and only the TOOL_MEMO_SIZE most recent
+    entries are kept, so the checkpointed memo stays small.
+    """
+    memo = dict(current or {})
+    for key, entry in (update or {}).items():
+        memo.pop(key, None)
+        memo[key] = entry
+
+    versions = {entry["corpus_version"] for entry in (update or {}).values()}
+    if versions:
+        memo = {key: entry for key, entry in memo.items() if entry["corpus_version"] in versions}
+    return dict(list(memo.items())[max(len(memo) - TOOL_MEMO_SIZE, 0):])
@@ -0,0 +1,132 @@
+from os import getenv
+from threading import Lock
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from pgvector.psycopg import register_vector, register_vector_async
+
+
+VECTOR_DB_URL = getenv("VECTOR_DB_URL")
+POSTGRES_URL = getenv("POSTGRES_URL")
+VECTOR_DB_POOL_MIN_SIZE = int(getenv("VECTOR_DB_POOL_MIN_SIZE", "2"))
+VECTOR_DB_POOL_MAX_SIZE = int(getenv("VECTOR_DB_POOL_MAX_SIZE", "10"))
+CHECKPOINT_POOL_MIN_SIZE = int(getenv("CHECKPOINT_POOL_MIN_SIZE", "1"))
+CHECKPOINT_POOL_MAX_SIZE = int(getenv("CHECKPOINT_POOL_MAX_SIZE", "10"))
+# Seconds a caller waits for a free connection before PoolTimeout
+DB_POOL_TIMEOUT = float(getenv("DB_POOL_TIMEOUT", "30"))
+
+# Connection settings required by the LangGraph Postgres checkpointer
+CHECKPOINT_CONNECTION_KWARGS = {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+
+pools = {}
+pools_lock = Lock()
+
+
+def create_vector_extension():
+    """pgvector types must exist before pooled connections can register them"""
+    with psycopg.connect(VECTOR_DB_URL, autocommit=True) as conn:
+        conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+
+def configure_vector_connection(conn):
+    register_vector(conn)
+
+
+async def configure_async_vector_connection(conn):
+    await register_vector_async(conn)
+
+
+def get_pool(name, factory):
+    """Return the process-wide pool `name`, creating and opening it on first use"""
+    with pools_lock:
+        if name not in pools:
+            pools[name] = factory()
+        return pools[name]
+
+
+def get_vector_pool():
+    """Pool of autocommit connections to the vector database, with pgvector registered"""
+    def create():
+        create_vector_extension()
+        return ConnectionPool(
+            VECTOR_DB_URL,
+            min_size=VECTOR_DB_POOL_MIN_SIZE,
+            max_size=VECTOR_DB_POOL_MAX_SIZE,
+            kwargs={"autocommit": True},
+            configure=configure_vector_connection,
+            check=ConnectionPool.check_connection,
+            timeout=DB_POOL_TIMEOUT,
+            name="vector",
+            open=True
+        )
+    return get_pool("vector", create)
+
+
+async def open_async_pools(vector=True):
+    """Open the async pools; they are bound to the running event loop, so
+    this is done from the FastAPI lifespan rather than on first use. Without
+    `vector` only the checkpoint pool is opened."""
+    opened = {}
+    if vector:
+        opened["vector_async"] = AsyncConnectionPool(
+            VECTOR_DB_URL,
+            min_size=VECTOR_DB_POOL_MIN_SIZE,
+            max_size=VECTOR_DB_POOL_MAX_SIZE,
+            kwargs={"autocommit": True},
+            configure=configure_async_vector_connection,
+            check=AsyncConnectionPool.check_connection,
+            timeout=DB_POOL_TIMEOUT,
+            name="vector_async",
+            open=False
+        )
+    opened["checkpoint_async"] = AsyncConnectionPool(
+        POSTGRES_URL,
+        min_size=CHECKPOINT_POOL_MIN_SIZE,
+        max_size=CHECKPOINT_POOL_MAX_SIZE,
+        kwargs=CHECKPOINT_CONNECTION_KWARGS,
+        check=AsyncConnectionPool.check_connection,
+        timeout=DB_POOL_TIMEOUT,
+        name="checkpoint_async",
+        open=False
+    )
+    for pool in opened.values():
+        await pool.open()
+    with pools_lock:
+        pools.update(opened)
+
+
+def get_async_vector_pool():
+    return pools["vector_async"]
+
+
+def get_async_checkpoint_pool():
+    return pools["checkpoint_async"]
+
+
+async def close_pools():
+    with pools_lock:
+        opened = dict(pools)
+        pools.clear()
+    for pool in opened.values():
+        if isinstance(pool, AsyncConnectionPool):
+            await pool.close()
+        else:
+            pool.close()
+
+
+def pool_stats():
+    """Size, usage and wait-time counters of every open pool.
+
+    requests_wait_ms / requests_num is the mean time callers waited for a
+    connection; requests_queued and requests_errors (timeouts) show a pool
+    that is too small for the load.
+    """
+    with pools_lock:
+        opened = dict(pools)
+    stats = {}
+    for name, pool in opened.items():
+        pool_stats = pool.get_stats()
+        requests = pool_stats.get("requests_num", 0)
+        pool_stats["requests_wait_ms_mean"] = pool_stats.get("requests_wait_ms", 0) / requests if requests else 0.0
+        stats[name] = pool_stats
+    return stats
@@ -0,0 +1,131 @@
+from math import ceil
+from os import getenv
+import re
+
+
+# Tokens of retrieved text handed to the model per search
+CONTEXT_TOKEN_BUDGET = int(getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Relevance / diversity trade-off of maximal marginal relevance (1 = relevance only)
+CONTEXT_MMR_LAMBDA = float(getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Word Jaccard similarity above which a chunk is dropped as a near-duplicate
+CONTEXT_DUPLICATE_THRESHOLD = float(getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def count_tokens(text):
+    """Estimated model tokens of a text: one per punctuation mark and one per
+    four characters of each word. No tokenizer of the Ollama models is
+    available in-process; this errs on the high side for Portuguese and
+    English text, so packed context stays within the budget."""
+    return sum(
+        ceil(len(token) / 4) if token[0].isalnum() or token[0] == "_" else 1
+        for token in TOKEN_PATTERN.findall(text)
+    )
+
+
+def token_count(document):
+    # Documents ingested before token counts were stored have none
+    if document.get("token_count") is None:
+        return count_tokens(document["text"])
+    return document["token_count"]
+
+
+def relevance(document):
+    """Rank score of a search result: the fusion score of hybrid searches,
+    the cosine similarity otherwise"""
+    return document.get("score", document["distance"])
+
+
+def merge_chunks(documents):
+    """Merge results that are overlapping or adjacent pieces of the same page.
+
+    Chunks are split per page with an overlap, so neighbouring chunks of a
+    page repeat text; a merged result covers their union once. It keeps the
+    best relevance of its pieces and the ids of all of them. Results without
+    a start_index (ingested before it was stored) are kept as they are.
+    """
+    merged = []
+    spans = {}
+    for document in sorted(documents, key=lambda document: (document.get("start_index") is None, document.get("start_index") or 0)):
+        document = {**document, "ids": [document["id"]], "token_count": token_count(document)}
+        start = document.get("start_index")
+        if start is None:
+            merged.append(document)
+            continue
+
+        key = (document["file_id"], document.get("page"))
+        current = spans.get(key)
+        end = start + len(document["text"])
+        if current is None or start > current["start_index"] + len(current["text"]):
+            spans[key] = document
+            merged.append(document)
+            continue
+
+        current_end = current["start_index"] + len(current["text"])
+        if end > current_end:
+            overlap = current_end - start
+            # Token count of the new part, prorated from the stored count
+            added = ceil(document["token_count"] * (len(document["text"]) - overlap) / len(document["text"]))
+            current["text"] += document["text"][overlap:]
+            current["token_count"] += added
+        current["ids"].append(document["id"])
+        for field in ("distance", "score"):
+            if field in document:
+                current[field] = max(current[field], document[field])
+
+    return sorted(merged, key=relevance, reverse=True)
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def pack_context(documents, budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=CONTEXT_MMR_LAMBDA, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """Turn search results into the context handed to the model.
+
+    Overlapping chunks are merged (see merge_chunks), then results are taken
+    in maximal marginal relevance order: relevance, normalized to the best
+    result, minus its word Jaccard similarity to the results already taken.
+    Near-duplicates are dropped, and results that would exceed `budget`
+    tokens are skipped. If even the best result does not fit, it is cut to
+    the budget. Token counts are the ones stored at ingestion, so they are
+    not recomputed at query time.
+    """
+    candidates = merge_chunks(documents)
+    if not candidates:
+        return []
+
+    best = abs(relevance(candidates[0])) or 1.0
+    words = [set(WORD_PATTERN.findall(document["text"].lower())) for document in candidates]
+    similarity = [0.0] * len(candidates)
+    remaining = list(range(len(candidates)))
+    packed = []
+    used = 0
+
+    while remaining:
+        index = max(
+            remaining,
+            key=lambda index: mmr_lambda * relevance(candidates[index]) / best - (1 - mmr_lambda) * similarity[index]
+        )
+        remaining.remove(index)
+        document = candidates[index]
+        if similarity[index] >= duplicate_threshold:
+            continue
+
+        if used + document["token_count"] > budget:
+            if packed:
+                continue
+            # Cut the best result to the budget rather than return nothing
+            length = len(document["text"]) * budget // document["token_count"]
+            document = {**document, "text": document["text"][:length], "token_count": budget}
+
+        packed.append(document)
+        used += document["token_count"]
+        for other in remaining:
+            similarity[other] = max(similarity[other], jaccard(words[index], words[other]))
+
+    return packed
@@ -1,13 +1,20 @@
-import pymupdf
-from langchain_ollama import OllamaEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from uuid import uuid4
-from io import BytesIO
+from hashlib import sha256
+import asyncio
+import re
+import unicodedata
 from langchain_core.documents import Document
-from unstructured.partition.auto import partition
+from extraction import PdfExtractor
+from embeddings import get_embedding_service
+from context_packing import count_tokens
+from connection_pools import get_vector_pool, get_async_vector_pool
+from retrieval_cache import get_retrieval_cache, notify_documents_changed, search_scope
+from vector_index import maybe_build_vector_index, search_settings, DOCUMENT_PARTITIONS, HNSW_EF_SEARCH
 from os import getenv
-import psycopg
-from pgvector.psycopg import register_vector
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+import time
 
 
 OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
@@ -18,6 +25,27 @@ DOCUMENTS_VECTOR_DIMENSION = int(getenv("DOCUMENTS_VECTOR_DIMENSION"))
 TEXT_SPLITTER_CHUNK_SIZE = int(getenv("TEXT_SPLITTER_CHUNK_SIZE"))
 DIFFICULTIES_VECTOR_DIMENSION = int(getenv("DIFFICULTIES_VECTOR_DIMENSION"))
 DIFFICULTIES_COLLECTION_NAME = getenv("DIFFICULTIES_COLLECTION_NAME")
+FILES_COLLECTION_NAME = getenv("FILES_COLLECTION_NAME", "files_collection")
+INGESTION_BATCH_SIZE = int(getenv("INGESTION_BATCH_SIZE", "32"))
+INGESTION_QUEUE_SIZE = int(getenv("INGESTION_QUEUE_SIZE", "4"))
+# Seconds without a committed batch after which an incomplete file is
+# considered abandoned and hidden from search
+INGESTION_STALE_AFTER = int(getenv("INGESTION_STALE_AFTER", "600"))
+# "vector" (float32), "halfvec" (float16) or "binary" (float32 re-ranking a
+# binary-quantized index), see vector_index.STORAGE_MODES
+VECTOR_STORAGE = getenv("VECTOR_STORAGE", "vector")
+VECTOR_RERANK_FACTOR = int(getenv("VECTOR_RERANK_FACTOR", "10"))
+# "vector" ranks by cosine distance only, "hybrid" fuses it with full-text
+# ranking by reciprocal rank fusion
+SEARCH_MODE = getenv("SEARCH_MODE", "vector")
+# "postgres" (pgvector) or "numpy" (memory-mapped matrices on local disk,
+# see numpy_vector_store)
+VECTOR_STORE_BACKEND = getenv("VECTOR_STORE_BACKEND", "postgres")
+HYBRID_CANDIDATES = int(getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(getenv("RRF_K", "60"))
+# Evaluation runs search only the evaluation documents, everything else only
+# the production documents
+SEARCH_PARTITION = "evaluation" if bool(int(getenv("EVALUATION", "0"))) else "production"
 
 
 def initialize_vector_database(conn):
@@ -32,13 +60,77 @@ def initialize_vector_database(conn):
                 file_id VARCHAR(50),
                 filename TEXT,
                 keywords TEXT[],
+                page INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS page INTEGER")
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS chunk_hash CHAR(64)")
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ALTER COLUMN keywords SET DEFAULT '{{}}'")
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS vector_half halfvec({DOCUMENTS_VECTOR_DIMENSION})")
+        # Offset of the chunk in its page's text and its estimated token
+        # count, used by context_packing to merge overlapping chunks and fit
+        # retrieved text into a token budget
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS start_index INTEGER")
+        cur.execute(f"ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS token_count INTEGER")
+        # Lexemes under both text search configurations, for hybrid search.
+        # Adding the column rewrites the table once; afterwards Postgres
+        # keeps it up to date on insert.
+        cur.execute(f"""
+            ALTER TABLE {DOCUMENTS_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS text_search tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector('portuguese', coalesce(text, '')) || to_tsvector('english', coalesce(text, ''))
+            ) STORED
+        """)
+
+        # Filter indexes for search; each keyword partition also gets its own
+        # partial ANN index (see vector_index.DOCUMENT_PARTITIONS)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {DOCUMENTS_COLLECTION_NAME}_keywords_idx
+            ON {DOCUMENTS_COLLECTION_NAME} USING GIN (keywords)
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {DOCUMENTS_COLLECTION_NAME}_file_id_idx
+            ON {DOCUMENTS_COLLECTION_NAME} (file_id)
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {DOCUMENTS_COLLECTION_NAME}_text_search_idx
+            ON {DOCUMENTS_COLLECTION_NAME} USING GIN (text_search)
+        """)
+
+        # Content fingerprints: a chunk is stored once per file, and its hash
+        # lets identical chunks in other files reuse the stored vector
+        cur.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {DOCUMENTS_COLLECTION_NAME}_file_chunk_hash_idx
+            ON {DOCUMENTS_COLLECTION_NAME} (file_id, chunk_hash)
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {DOCUMENTS_COLLECTION_NAME}_chunk_hash_idx
+            ON {DOCUMENTS_COLLECTION_NAME} (chunk_hash)
+        """)
 
-        # All indexes removed for simplicity and accuracy
-        # For small datasets (<10k documents), sequential scans are fast enough
-        # Add indexes back if you need optimization on larger datasets
+        # Create files table, one row per ingested file fingerprint
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {FILES_COLLECTION_NAME} (
+                file_id VARCHAR(50) PRIMARY KEY,
+                file_hash CHAR(64) NOT NULL,
+                filename TEXT,
+                keywords TEXT[] NOT NULL DEFAULT '{{}}',
+                chunks INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        """)
+        # Time of the file's last committed batch, see STALLED_FILES_FILTER
+        cur.execute(f"ALTER TABLE {FILES_COLLECTION_NAME} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP")
+        cur.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {FILES_COLLECTION_NAME}_file_hash_idx
+            ON {FILES_COLLECTION_NAME} (file_hash, keywords)
+        """)
+
+        # ANN indexes are managed by vector_index: sequential scans are exact
+        # and fast enough for small tables, so the index is only built once a
+        # table passes VECTOR_INDEX_MIN_ROWS
 
         # Create difficulties table
         cur.execute(f"""
@@ -50,79 +142,690 @@ def initialize_vector_database(conn):
             )
         """)
 
-        # All indexes removed for simplicity and accuracy
-        # For small datasets, sequential scans are fast enough
 
+def file_fingerprint(source):
+    """SHA-256 of a file given as bytes or as a path on disk"""
+    if isinstance(source, (bytes, bytearray)):
+        return sha256(source).hexdigest()
+
+    digest = sha256()
+    with open(source, "rb") as file:
+        while block := file.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_fingerprint(text):
+    """SHA-256 of the chunk text with unicode and whitespace normalized"""
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def file_lock_key(file_hash, keywords):
+    """Advisory lock key (a signed 64-bit integer) of a file fingerprint and
+    keywords, the unique key of files_collection"""
+    digest = sha256(f"{file_hash}:{','.join(keywords)}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def storage_column(storage=VECTOR_STORAGE):
+    """Column holding document vectors, and its SQL type, for a storage mode"""
+    if storage == "halfvec":
+        return "vector_half", "halfvec"
+    return "vector", "vector"
+
+
+def document_search_sql(storage, where_clause, query=None):
+    """Nearest-neighbour query over documents for a storage mode.
+
+    Parameters: the query vector for the distance, the filter parameters,
+    the query vector for the ordering and the limit. In binary mode the
+    index ranks rows by Hamming distance between binary-quantized vectors,
+    and the best `rerank` candidates are re-ranked by exact float32 cosine
+    distance; its parameters are the query vector, the filter parameters,
+    the query vector again, the number of candidates, the query vector and
+    the limit.
+
+    With `query`, an SQL expression of type vector such as a column of an
+    outer query, the query vector is read from it instead of parameters.
+    """
+    def query_vector(vector_type="vector"):
+        return f"%s::{vector_type}" if query is None else f"{query}::{vector_type}"
+
+    if storage == "binary":
+        return f"""
+            SELECT id, text, file_id, keywords, page, start_index, token_count,
+                   1 - (vector <=> {query_vector()}) as distance
+            FROM (
+                SELECT id, text, file_id, keywords, page, start_index, token_count, vector
+                FROM {DOCUMENTS_COLLECTION_NAME}
+                {where_clause}
+                ORDER BY binary_quantize(vector)::bit({DOCUMENTS_VECTOR_DIMENSION}) <~> binary_quantize({query_vector()})
+                LIMIT %s
+            ) candidates
+            ORDER BY vector <=> {query_vector()}
+            LIMIT %s
+        """
+
+    column, vector_type = storage_column(storage)
+    return f"""
+        SELECT id, text, file_id, keywords, page, start_index, token_count,
+               1 - ({column} <=> {query_vector(vector_type)}) as distance
+        FROM {DOCUMENTS_COLLECTION_NAME}
+        {where_clause}
+        ORDER BY {column} <=> {query_vector(vector_type)}
+        LIMIT %s
+    """
+
+
+# FileIngestion commits a file's chunks batch by batch, bumping `updated_at`
+# on its files_collection row with each batch, and sets `chunks` once the
+# last batch is written. Committed batches are searchable right away, but an
+# incomplete file with no batch for INGESTION_STALE_AFTER seconds was left by
+# an ingest that died and is hidden until it is uploaded again. Documents
+# ingested before files were fingerprinted have no row and stay visible.
+STALLED_FILES_FILTER = f"""NOT EXISTS (
+    SELECT 1 FROM {FILES_COLLECTION_NAME} files
+    WHERE files.file_id = {DOCUMENTS_COLLECTION_NAME}.file_id AND files.chunks IS NULL
+    AND files.updated_at < now() - interval '{INGESTION_STALE_AFTER} seconds'
+)"""
+
+# Stricter: every file still being ingested is excluded, for copies of the
+# collection that are only built once
+INCOMPLETE_FILES_FILTER = f"""NOT EXISTS (
+    SELECT 1 FROM {FILES_COLLECTION_NAME} files
+    WHERE files.file_id = {DOCUMENTS_COLLECTION_NAME}.file_id AND files.chunks IS NULL
+)"""
+
+
+def document_filters(partition=None, keywords=None, file_ids=None):
+    """WHERE clause and parameters restricting a documents search.
+
+    The partition predicate is inlined verbatim so the planner can match it
+    to that partition's partial ANN index; keywords use the GIN index and
+    file_ids the file_id index. Chunks of abandoned ingests are always
+    excluded (see STALLED_FILES_FILTER).
+    """
+    clauses, params = [STALLED_FILES_FILTER], []
+    if partition:
+        clauses.append(DOCUMENT_PARTITIONS[partition])
+    if keywords:
+        clauses.append("keywords @> %s::text[]")
+        params.append(list(keywords))
+    if file_ids:
+        clauses.append("file_id = ANY(%s)")
+        params.append(list(file_ids))
+
+    return "WHERE " + " AND ".join(clauses), params
+
+
+def text_search_query(text):
+    """tsquery matching any lexeme of `text` (an SQL expression) under the
+    Portuguese or the English configuration. Lexemes are OR-ed rather than
+    AND-ed, as questions rarely contain every term of a chunk; ts_rank_cd
+    ranks chunks matching more of them higher."""
+    return (
+        f"(replace(plainto_tsquery('portuguese', {text})::text, '&', '|')::tsquery"
+        f" || replace(plainto_tsquery('english', {text})::text, '&', '|')::tsquery)"
+    )
+
+
+def hybrid_search_sql(storage, where_clause, query=None, text=None):
+    """Hybrid query over documents: the HYBRID_CANDIDATES nearest chunks and
+    the HYBRID_CANDIDATES best full-text matches are fused by reciprocal
+    rank fusion, score = sum of 1 / (RRF_K + rank) over both rankings.
+
+    Parameters: those of document_search_sql (with the candidates as its
+    limit), the query text twice, the filter parameters, the candidates, the
+    query vector and the limit. With `query` and `text`, SQL expressions such
+    as columns of an outer query, the query vector and text are read from
+    them instead of parameters.
+    """
+    semantic = document_search_sql(storage, where_clause, query)
+    text_query = text_search_query("%s" if text is None else text)
+    match = "text_search @@ text_query.query"
+    lexical_where = f"{where_clause} AND {match}" if where_clause else f"WHERE {match}"
+    column, vector_type = storage_column(storage)
+    query_vector = f"%s::{vector_type}" if query is None else f"{query}::{vector_type}"
+
+    return f"""
+        WITH semantic AS (
+            SELECT id, row_number() OVER (ORDER BY distance DESC) AS rank
+            FROM ({semantic}) semantic_results
+        ),
+        lexical AS (
+            SELECT id, row_number() OVER (ORDER BY ts_rank_cd(text_search, text_query.query) DESC) AS rank
+            FROM {DOCUMENTS_COLLECTION_NAME}, (SELECT {text_query} AS query) text_query
+            {lexical_where}
+            ORDER BY ts_rank_cd(text_search, text_query.query) DESC
+            LIMIT %s
+        )
+        SELECT documents.id, documents.text, documents.file_id, documents.keywords,
+               documents.page, documents.start_index, documents.token_count,
+               1 - (documents.{column} <=> {query_vector}) AS distance,
+               COALESCE(1.0 / ({RRF_K} + semantic.rank), 0) + COALESCE(1.0 / ({RRF_K} + lexical.rank), 0) AS score
+        FROM semantic
+        FULL OUTER JOIN lexical ON lexical.id = semantic.id
+        JOIN {DOCUMENTS_COLLECTION_NAME} documents ON documents.id = COALESCE(semantic.id, lexical.id)
+        ORDER BY score DESC
+        LIMIT %s
+    """
+
+
+def search_limits(storage, top_k, ef_search):
+    """(limits, ef_search) of a vector search: the LIMIT parameters of
+    document_search_sql, in order. In binary mode the index scan must
+    return every candidate that is re-ranked."""
+    if storage == "binary":
+        candidates = top_k * VECTOR_RERANK_FACTOR
+        # The HNSW scan returns at most ef_search candidates
+        return (candidates, top_k), max(ef_search or HNSW_EF_SEARCH, candidates)
+    return (top_k,), ef_search
+
+
+def document_search(storage, embedding, top_k, partition=None, keywords=None, file_ids=None, ef_search=None, probes=None, text=None):
+    """(settings, sql, params) of a documents search by query vector, hybrid
+    with full-text search on `text` when it is given"""
+    where_clause, filter_params = document_filters(partition, keywords, file_ids)
 
-class FileIngestion:
-    def __init__(self) -> None:
-        self.embedding_model = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
+    if text is None:
+        sql = document_search_sql(storage, where_clause)
+        limits, ef_search = search_limits(storage, top_k, ef_search)
+        if storage == "binary":
+            params = (embedding, *filter_params, embedding, limits[0], embedding, limits[1])
+        else:
+            params = (embedding, *filter_params, embedding, *limits)
+    else:
+        sql = hybrid_search_sql(storage, where_clause)
+        limits, ef_search = search_limits(storage, HYBRID_CANDIDATES, ef_search)
+        if storage == "binary":
+            semantic_params = (embedding, *filter_params, embedding, limits[0], embedding, limits[1])
+        else:
+            semantic_params = (embedding, *filter_params, embedding, *limits)
+        params = (*semantic_params, text, text, *filter_params, HYBRID_CANDIDATES, embedding, top_k)
+
+    # document_filters always adds STALLED_FILES_FILTER, which no index covers
+    settings = search_settings(ef_search, probes, filtered=True)
+    return settings, sql, params
+
+
+def document_search_many(storage, embeddings, top_k, partition=None, keywords=None, file_ids=None, ef_search=None, probes=None, texts=None):
+    """(settings, sql, params) of one statement searching documents for
+    every query vector in `embeddings` (hybrid with `texts` when given).
+
+    The vectors are sent as a single array and unnested; each one drives the
+    same subquery as document_search through a LATERAL join, so the ANN
+    index is still used per query. Rows come back ordered by query position
+    (1-based `ordinality`), then by rank.
+    """
+    where_clause, filter_params = document_filters(partition, keywords, file_ids)
+    vectors = ["[" + ",".join(str(float(value)) for value in embedding) + "]" for embedding in embeddings]
+
+    if texts is None:
+        lateral = document_search_sql(storage, where_clause, query="queries.embedding")
+        limits, ef_search = search_limits(storage, top_k, ef_search)
+        sql = f"""
+            SELECT queries.ordinality, results.*
+            FROM unnest(%s::text[]::vector[]) WITH ORDINALITY AS queries(embedding, ordinality)
+            CROSS JOIN LATERAL ({lateral}) results
+            ORDER BY queries.ordinality, results.distance DESC
+        """
+        params = (vectors, *filter_params, *limits)
+    else:
+        lateral = hybrid_search_sql(storage, where_clause, query="queries.embedding", text="queries.text")
+        limits, ef_search = search_limits(storage, HYBRID_CANDIDATES, ef_search)
+        sql = f"""
+            SELECT queries.ordinality, results.*
+            FROM unnest(%s::text[]::vector[], %s::text[]) WITH ORDINALITY AS queries(embedding, text, ordinality)
+            CROSS JOIN LATERAL ({lateral}) results
+            ORDER BY queries.ordinality, results.score DESC
+        """
+        params = (vectors, list(texts), *filter_params, *limits, *filter_params, HYBRID_CANDIDATES, top_k)
+
+    # document_filters always adds STALLED_FILES_FILTER, which no index covers
+    settings = search_settings(ef_search, probes, filtered=True)
+    return settings, sql, params
+
+
+def group_results(rows, count):
+    """Split search_many rows (ordinality, *document row) into one list per query"""
+    results = [[] for _ in range(count)]
+    for row in rows:
+        results[row[0] - 1].append(document_result(row[1:]))
+    return results
+
+
+def document_result(row):
+    result = {
+        "id": row[0],
+        "text": row[1],
+        "file_id": row[2],
+        "keywords": row[3] if row[3] else [],
+        "page": row[4],
+        "start_index": row[5],
+        "token_count": row[6],
+        "distance": float(row[7])
+    }
+    if len(row) > 8:
+        # Reciprocal rank fusion score of a hybrid search
+        result["score"] = float(row[8])
+    return result
+
+
+def document_scope(storage, top_k, partition, keywords, file_ids, ef_search, probes, hybrid):
+    """Retrieval cache scope of a documents search"""
+    return search_scope(
+        top_k,
+        partition,
+        keywords,
+        file_ids,
+        storage=storage,
+        text=hybrid,
+        ef_search=ef_search,
+        probes=probes
+    )
+
+
+def cached_results(cache, embeddings, scopes):
+    """Cached results per query (None when missing, or without a cache) of a search_many"""
+    if not cache:
+        return [None] * len(embeddings)
+    return [cache.get(embedding, scope) for embedding, scope in zip(embeddings, scopes)]
+
+
+def difficulty_result(row):
+    return {
+        "id": row[0],
+        "text": row[1],
+        "distance": float(row[2])
+    }
+
+
+INSERT_DIFFICULTY_SQL = f"""
+    INSERT INTO {DIFFICULTIES_COLLECTION_NAME}
+    (vector, text)
+    VALUES (%s, %s)
+    RETURNING id
+"""
+
+QUERY_DIFFICULTIES_SQL = f"""
+    SELECT id, text
+    FROM {DIFFICULTIES_COLLECTION_NAME}
+    ORDER BY created_at DESC
+    LIMIT %s
+"""
+
+# Changes whenever a file commits a batch, finishes ingesting, is deleted or
+# stalls (see STALLED_FILES_FILTER)
+CORPUS_VERSION_SQL = f"""
+    SELECT count(*) FILTER (WHERE chunks IS NOT NULL),
+           count(*) FILTER (WHERE chunks IS NULL AND updated_at >= now() - interval '{INGESTION_STALE_AFTER} seconds'),
+           max(COALESCE(updated_at, created_at))
+    FROM {FILES_COLLECTION_NAME}
+    WHERE chunks IS NOT NULL OR updated_at IS NOT NULL
+"""
+
+
+def corpus_version(row):
+    complete, ingesting, latest = row
+    return f"{complete}:{ingesting}:{latest.isoformat() if latest else ''}"
+
+
+SEARCH_DIFFICULTIES_SQL = f"""
+    SELECT id, text,
+           1 - (vector <=> %s::vector) as distance
+    FROM {DIFFICULTIES_COLLECTION_NAME}
+    ORDER BY vector <=> %s::vector
+    LIMIT %s
+"""
+
+
+PIPELINE_DONE = object()
+
+
+class PipelineStage:
+    """Runs an iterable in a background thread and hands its items to the
+    next stage through a bounded queue, so a fast producer blocks instead of
+    buffering the whole document in memory."""
+
+    def __init__(self, name, source, maxsize=INGESTION_QUEUE_SIZE) -> None:
+        self.name = name
+        self.queue = Queue(maxsize=maxsize)
+        self.stopped = Event()
+        self.error = None
+        self.thread = Thread(target=self.run, args=(source,), name=f"ingest-{name}", daemon=True)
+        self.thread.start()
+
+    def run(self, source):
+        try:
+            for item in source:
+                if not self.put(item):
+                    return
+        except Exception as error:
+            self.error = error
+        finally:
+            # Closes the page generator (and the PDF) when the stage stops early
+            if hasattr(source, "close"):
+                source.close()
+            self.put(PIPELINE_DONE)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def stop(self):
+        """Make the stage's thread and its consumer return after their
+        current item"""
+        self.stopped.set()
+
+    def __iter__(self):
+        # A stopped upstream stage may never deliver PIPELINE_DONE, so the
+        # wait is bounded and rechecks `stopped`
+        while not self.stopped.is_set():
+            try:
+                item = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is PIPELINE_DONE:
+                if self.error is not None:
+                    raise RuntimeError(f"Ingestion stage '{self.name}' failed: {self.error}") from self.error
+                return
+            yield item
+
+
+class DocumentChunker:
+    """Extracts, splits and embeds PDFs: the stages of FileIngestion that do
+    not touch the database, also used by scripts/build_numpy_store.py."""
+
+    def __init__(self, batch_size=INGESTION_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self.embedding_model = get_embedding_service()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=TEXT_SPLITTER_CHUNK_SIZE,
             chunk_overlap=200,
             add_start_index=True
         )
+        self.extractor = PdfExtractor()
+
+    def iter_pages(self, file):
+        """Yield (page_number, text) for every page of the PDF"""
+        return self.extractor.iter_pages(file)
+
+    def track_pages(self, pages, progress):
+        for page in pages:
+            progress(pages=1)
+            yield page
+
+    def split_pages(self, pages):
+        """Yield (page_number, start_index, chunk_text) for every chunk of
+        every page, start_index being the chunk's offset in the page text"""
+        for page_number, text in pages:
+            for split in self.text_splitter.split_documents([Document(page_content=text)]):
+                yield page_number, split.metadata["start_index"], split.page_content
+
+    def embed_batches(self, chunks):
+        """Embed chunks batch_size at a time, yielding
+        [(page, start_index, text, chunk_hash, embedding)] batches.
+
+        Chunks repeated within the file are dropped, and chunks already stored
+        for another file reuse that vector instead of being embedded again.
+        """
+        seen = set()
+        batch = []
+        for page, start_index, text in chunks:
+            chunk_hash = chunk_fingerprint(text)
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+
+            batch.append((page, start_index, text, chunk_hash))
+            if len(batch) >= self.batch_size:
+                yield self.embed_batch(batch)
+                batch = []
+        if batch:
+            yield self.embed_batch(batch)
+
+    def embed_batch(self, batch):
+        stored_vectors = self.find_vectors([chunk_hash for _, _, _, chunk_hash in batch])
+        missing = [text for _, _, text, chunk_hash in batch if chunk_hash not in stored_vectors]
+        if missing:
+            embeddings = iter(self.embedding_model.embed_documents(missing))
+
+        results = []
+        for page, start_index, text, chunk_hash in batch:
+            embedding = stored_vectors[chunk_hash] if chunk_hash in stored_vectors else next(embeddings)
+            results.append((page, start_index, text, chunk_hash, embedding))
+        return results
+
+    def find_vectors(self, chunk_hashes):
+        """Map chunk hashes that are already stored to their vectors; nothing
+        is stored without a database"""
+        return {}
+
+
+class FileIngestion(DocumentChunker):
+    """Ingests files over connections borrowed from the process-wide pool.
+    Creating one is cheap; the schema is set up once at startup (see
+    initialize_vector_database)."""
 
-        # Connect to PostgreSQL with pgvector
-        self.conn = psycopg.connect(VECTOR_DB_URL, autocommit=True)
-        with self.conn.cursor() as cur:
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
-        register_vector(self.conn)
+    def __init__(self, batch_size=INGESTION_BATCH_SIZE, pool=None) -> None:
+        super().__init__(batch_size)
+        self.pool = pool or get_vector_pool()
 
-        # Initialize database tables and indexes
-        initialize_vector_database(self.conn)
+    def ingest(self, file, filename, evaluation=False, pages=None, progress=None):
+        """Stream a PDF, given as bytes or as a path, through extract -> split -> embed -> store.
 
-    def ingest(self, file_bytes, filename, evaluation=False):
-        file_id = str(uuid4())
+        Each stage runs in its own thread behind a bounded queue, so memory
+        stays flat regardless of document size. Batches are searchable as soon
+        as they are committed (see STALLED_FILES_FILTER). If any stage fails,
+        the chunks already stored for the file are removed.
 
-        text = self.extract_text(file_bytes)
-        pieces, embeddings = self.embed_text(text)
+        Files are fingerprinted by content: ingesting the same bytes again
+        with the same keywords is a no-op that returns the existing file_id.
+        An earlier ingest of the file that never completed (its process died)
+        is redone under the same file_id, see register_file.
+
+        `pages` can supply the (page_number, text) iterable from elsewhere,
+        e.g. an IngestionExecutor extracting in worker processes; by default
+        the file is extracted in this process.
+
+        `progress`, if given, is called with pages/chunks/rows increments as
+        pages are extracted, batches embedded and rows written.
+        """
+        if progress is None:
+            progress = lambda **counts: None
 
-        # Store all chunks with the same file_id and filename
         keywords = []
         if evaluation:
             keywords.append("evaluation")
-        with self.conn.cursor() as cur:
-            for piece, embedding in zip(pieces, embeddings):
+
+        file_hash = file_fingerprint(file)
+        # The connection holding the file's claim is kept for the whole ingest
+        with self.pool.connection() as conn:
+            file_id, created = self.register_file(conn, file_hash, filename, keywords)
+            if not created:
+                print(f"Skipping {filename}: identical file already ingested as {file_id}")
+                return file_id
+
+            try:
+                if pages is None:
+                    pages = self.iter_pages(file)
+
+                pages = PipelineStage("extract", self.track_pages(pages, progress))
+                chunks = PipelineStage("split", self.split_pages(pages))
+                batches = PipelineStage("embed", self.embed_batches(chunks))
+                stages = [pages, chunks, batches]
+
+                stored = 0
+                start = time.perf_counter()
+                try:
+                    for batch in batches:
+                        progress(chunks=len(batch))
+                        # Store all chunks with the same file_id and filename
+                        rows = [
+                            (embedding, piece, file_id, filename, keywords, page, chunk_hash, start_index, count_tokens(piece))
+                            for page, start_index, piece, chunk_hash, embedding in batch
+                        ]
+                        written = self.store_chunks(conn, rows, file_id)
+                        stored += written
+                        progress(rows=written)
+                except BaseException:
+                    for stage in stages:
+                        stage.stop()
+                    self.delete_file(file_id, conn)
+                    raise
+
+                self.complete_file(conn, file_id, stored)
+            finally:
+                self.release_file(conn, file_hash, keywords)
+        print(f"Ingested {filename}: {stored} chunks in {time.perf_counter() - start:.3f}s")
+
+        with self.pool.connection() as conn:
+            maybe_build_vector_index(
+                conn,
+                DOCUMENTS_COLLECTION_NAME,
+                partitions=DOCUMENT_PARTITIONS,
+                storage=VECTOR_STORAGE,
+                dimension=DOCUMENTS_VECTOR_DIMENSION
+            )
+        return file_id
+
+    def register_file(self, conn, file_hash, filename, keywords):
+        """Claim a file fingerprint, returning (file_id, created).
+
+        The claim holds a session-level advisory lock on the fingerprint
+        until release_file, and the lock dies with `conn`. So a row
+        found with `chunks` still NULL while holding the lock was left by an
+        ingest whose process died: its chunks are deleted and the file is
+        ingested again under the same file_id. A concurrent upload of the
+        same file waits here until the first one is done.
+        """
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (file_lock_key(file_hash, keywords),))
+            try:
                 cur.execute(
                     f"""
-                    INSERT INTO {DOCUMENTS_COLLECTION_NAME}
-                    (vector, text, file_id, filename, keywords)
-                    VALUES (%s, %s, %s, %s, %s)
+                    SELECT file_id, chunks FROM {FILES_COLLECTION_NAME}
+                    WHERE file_hash = %s AND keywords = %s
                     """,
-                    (embedding, piece, file_id, filename, keywords)
+                    (file_hash, keywords)
                 )
+                row = cur.fetchone()
+                if row is None:
+                    file_id = str(uuid4())
+                    cur.execute(
+                        f"""
+                        INSERT INTO {FILES_COLLECTION_NAME} (file_id, file_hash, filename, keywords)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (file_id, file_hash, filename, keywords)
+                    )
+                    return file_id, True
 
-    def extract_text(self, file_bytes):
-        try:
-            print("Ingesting with unstructured")
-            elements = partition(file=BytesIO(file_bytes), content_type="application/pdf", languages=["por", "eng"])
-            text = ""
-            for element in elements:
-                text += f"\n{str(element)}"
-        except Exception as error:
-            print(f"Error while ingesting with unstructured: {error}")
-            print("Ingesting with PyMuPDF")
-            document = pymupdf.Document(stream=file_bytes)
-            text = ""
-            for page in document:
-                text += page.get_text()
-        finally:
-            return text
+                file_id, chunks = row
+                if chunks is not None:
+                    self.release_file(conn, file_hash, keywords)
+                    return file_id, False
+
+                print(f"Resuming incomplete ingestion of {filename} as {file_id}")
+                with conn.transaction():
+                    cur.execute(f"DELETE FROM {DOCUMENTS_COLLECTION_NAME} WHERE file_id = %s", (file_id,))
+                    cur.execute(
+                        f"UPDATE {FILES_COLLECTION_NAME} SET filename = %s, updated_at = NULL WHERE file_id = %s",
+                        (filename, file_id)
+                    )
+                    notify_documents_changed(conn, file_id)
+                return file_id, True
+            except BaseException:
+                self.release_file(conn, file_hash, keywords)
+                raise
+
+    def release_file(self, conn, file_hash, keywords):
+        """Release the claim taken by register_file on conn"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (file_lock_key(file_hash, keywords),))
+
+    def complete_file(self, conn, file_id, chunks):
+        with conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE {FILES_COLLECTION_NAME} SET chunks = %s, updated_at = now() WHERE file_id = %s",
+                (chunks, file_id)
+            )
+
+    def find_vectors(self, chunk_hashes):
+        """Map chunk hashes that are already stored to their vectors"""
+        column, _ = storage_column()
+        # Runs in the embed stage's thread, on a connection of its own
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT DISTINCT ON (chunk_hash) chunk_hash, {column}
+                FROM {DOCUMENTS_COLLECTION_NAME}
+                WHERE chunk_hash = ANY(%s) AND {column} IS NOT NULL
+                """,
+                (chunk_hashes,)
+            )
+            return {row[0]: row[1] for row in cur.fetchall()}
+
+    def store_chunks(self, conn, rows, file_id):
+        """Bulk load (vector, text, file_id, filename, keywords, page,
+        chunk_hash, start_index, token_count) rows of file_id with binary COPY.
 
-    def embed_text(self, text):
-        splits = self.text_splitter.split_documents([Document(page_content=text)])
-        text_splits = [split.page_content for split in splits]
-        embeddings = self.embedding_model.embed_documents(text_splits)
+        The rows are written in a single transaction that also bumps the
+        file's updated_at, so they are searchable once it commits, see
+        STALLED_FILES_FILTER.
+        """
+        column, vector_type = storage_column()
+        start = time.perf_counter()
+        with conn.transaction():
+            with conn.cursor() as cur:
+                with cur.copy(
+                    f"""
+                    COPY {DOCUMENTS_COLLECTION_NAME}
+                    ({column}, text, file_id, filename, keywords, page, chunk_hash, start_index, token_count)
+                    FROM STDIN WITH (FORMAT BINARY)
+                    """
+                ) as copy:
+                    copy.set_types([vector_type, "text", "varchar", "text", "text[]", "int4", "bpchar", "int4", "int4"])
+                    for row in rows:
+                        copy.write_row(row)
+                cur.execute(
+                    f"UPDATE {FILES_COLLECTION_NAME} SET updated_at = now() WHERE file_id = %s",
+                    (file_id,)
+                )
+            # Delivered on commit
+            notify_documents_changed(conn, file_id)
+        elapsed = time.perf_counter() - start
+        rows_per_second = len(rows) / elapsed if elapsed > 0 else float("inf")
+        print(f"Stored {len(rows)} chunks in {elapsed:.3f}s ({rows_per_second:.0f} rows/s)")
 
-        return text_splits, embeddings
+        return len(rows)
+
+    def delete_file(self, file_id, conn=None):
+        """Remove every chunk stored for a file_id, along with its fingerprint,
+        on conn or on a pooled connection"""
+        if conn is None:
+            with self.pool.connection() as conn:
+                return self.delete_file(file_id, conn)
+
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {DOCUMENTS_COLLECTION_NAME} WHERE file_id = %s", (file_id,))
+                cur.execute(f"DELETE FROM {FILES_COLLECTION_NAME} WHERE file_id = %s", (file_id,))
+            # Delivered on commit
+            notify_documents_changed(conn, file_id)
 
     def get_chunks_by_file_id(self, file_id):
         """Retrieve all chunks for a given file_id"""
-        with self.conn.cursor() as cur:
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(
                 f"""
-                SELECT id, text, filename
+                SELECT id, text, filename, page
                 FROM {DOCUMENTS_COLLECTION_NAME}
                 WHERE file_id = %s
                 ORDER BY id
@@ -133,121 +836,267 @@ class FileIngestion:
             return [{
                 "id": row[0],
                 "text": row[1],
-                "filename": row[2]
+                "filename": row[2],
+                "page": row[3]
             } for row in results]
 
-    def __del__(self):
-        if hasattr(self, 'conn'):
-            self.conn.close()
-
 
 class VectorStore:
-    def __init__(self) -> None:
-        self.embedding_model = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
-        self.conn = psycopg.connect(VECTOR_DB_URL, autocommit=True)
-        with self.conn.cursor() as cur:
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
-        register_vector(self.conn)
+    """Document search and difficulties over connections borrowed from the
+    process-wide pool. Creating one is cheap; the schema is set up once at
+    startup (see initialize_vector_database)."""
 
-        # Initialize database tables and indexes
-        initialize_vector_database(self.conn)
+    def __init__(self, storage=VECTOR_STORAGE, pool=None, search_mode=SEARCH_MODE, use_cache=True) -> None:
+        self.storage = storage
+        self.search_mode = search_mode
+        self.embedding_model = get_embedding_service()
+        self.pool = pool or get_vector_pool()
+        self.cache = get_retrieval_cache() if use_cache else None
 
     # Document search methods
-    def search(self, query, top_k=3):
+    def search(self, query, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
         """Search for documents by query string (embeds the query automatically)
 
         Args:
             query: The search query string
             top_k: Number of results to return
-            evaluation: If True, search only entries with 'evaluation' keyword.
-                       If False, search only entries without any keywords (default: False)
+            partition: "evaluation", "production" or None for every document.
+                       Defaults to "evaluation" when the EVALUATION env flag is set,
+                       otherwise "production"
+            keywords: Only entries having all of these keywords
+            file_ids: Only entries from these files
+            ef_search: HNSW candidate list size for this query (default: HNSW_EF_SEARCH)
+            probes: IVFFlat lists probed for this query (default: IVFFLAT_PROBES)
+
+        In hybrid search mode results are ordered by their fused "score"
+        rather than by "distance".
         """
-        evaluation = bool(int(getenv("EVALUATION", "0")))
-        print(f"Evaluation flag: {evaluation}")
         embedding = self.embedding_model.embed_query(query)
-        
-        # Build WHERE clause based on evaluation flag
-        if evaluation:
-            where_clause = "WHERE 'evaluation' = ANY(keywords)"
-        else:
-            where_clause = ""
+        text = query if self.search_mode == "hybrid" else None
+        return self.search_by_vector(embedding, top_k, partition, keywords, file_ids, ef_search, probes, text)
 
-        with self.conn.cursor() as cur:
-            cur.execute(
-                f"""
-                SELECT id, text, file_id, keywords,
-                       1 - (vector <=> %s::vector) as distance
-                FROM {DOCUMENTS_COLLECTION_NAME}
-                {where_clause}
-                ORDER BY vector <=> %s::vector
-                LIMIT %s
-                """,
-                (embedding, embedding, top_k)
-            )
+    def search_by_vector(self, embedding, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, text=None):
+        """Search for documents by query vector, fused with a full-text
+        search on `text` when it is given; see search. Results of similar
+        earlier queries are served from the retrieval cache."""
+        scope = document_scope(self.storage, top_k, partition, keywords, file_ids, ef_search, probes, text is not None)
+        generation = self.cache.generation if self.cache else None
+        if self.cache and (results := self.cache.get(embedding, scope)) is not None:
+            return results
 
-            results = cur.fetchall()
+        settings, sql, params = document_search(self.storage, embedding, top_k, partition, keywords, file_ids, ef_search, probes, text)
 
-            return [{
-                "id": row[0],
-                "text": row[1],
-                "file_id": row[2],
-                "keywords": row[3] if row[3] else [],
-                "distance": float(row[4])
-            } for row in results]
+        with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in settings:
+                cur.execute(setting)
+            cur.execute(sql, params)
+
+            results = [document_result(row) for row in cur.fetchall()]
+
+        if self.cache:
+            self.cache.put(embedding, scope, results, generation)
+        return results
+
+    def search_many(self, queries, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
+        """Search for several query strings at once, returning one result list
+        per query in the same order. The queries are embedded in one batch
+        and searched in one SQL statement; other arguments as in search."""
+        if not queries:
+            return []
+        embeddings = self.embedding_model.embed_documents(list(queries))
+        texts = list(queries) if self.search_mode == "hybrid" else None
+        return self.search_many_by_vector(embeddings, top_k, partition, keywords, file_ids, ef_search, probes, texts)
+
+    def search_many_by_vector(self, embeddings, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, texts=None):
+        """Search for several query vectors at once, see search_many. Only
+        the queries missing from the retrieval cache are sent to Postgres."""
+        scopes = [document_scope(self.storage, top_k, partition, keywords, file_ids, ef_search, probes, texts is not None)] * len(embeddings)
+        generation = self.cache.generation if self.cache else None
+        results = cached_results(self.cache, embeddings, scopes)
+        missing = [index for index, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        settings, sql, params = document_search_many(
+            self.storage,
+            [embeddings[index] for index in missing],
+            top_k, partition, keywords, file_ids, ef_search, probes,
+            [texts[index] for index in missing] if texts is not None else None
+        )
+
+        with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in settings:
+                cur.execute(setting)
+            cur.execute(sql, params)
+
+            found = group_results(cur.fetchall(), len(missing))
+
+        for index, result in zip(missing, found):
+            results[index] = result
+            if self.cache:
+                self.cache.put(embeddings[index], scopes[index], result, generation)
+        return results
+
+    def corpus_version(self):
+        """Token identifying the set of ingested documents, see CORPUS_VERSION_SQL"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(CORPUS_VERSION_SQL)
+            return corpus_version(cur.fetchone())
 
     # Difficulty management methods
     def insert_difficulty(self, text, vector):
         """Insert a difficulty with its vector into the difficulties collection"""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                f"""
-                INSERT INTO {DIFFICULTIES_COLLECTION_NAME}
-                (vector, text)
-                VALUES (%s, %s)
-                RETURNING id
-                """,
-                (vector, text)
-            )
-            return cur.fetchone()[0]
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(INSERT_DIFFICULTY_SQL, (vector, text))
+                difficulty_id = cur.fetchone()[0]
+
+            maybe_build_vector_index(conn, DIFFICULTIES_COLLECTION_NAME)
+        return difficulty_id
 
     def query_difficulties(self, limit=100):
         """Query all difficulties from the database"""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                f"""
-                SELECT id, text
-                FROM {DIFFICULTIES_COLLECTION_NAME}
-                ORDER BY created_at DESC
-                LIMIT %s
-                """,
-                (limit,)
-            )
-            results = cur.fetchall()
-            return [{"id": row[0], "text": row[1]} for row in results]
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(QUERY_DIFFICULTIES_SQL, (limit,))
+            return [{"id": row[0], "text": row[1]} for row in cur.fetchall()]
 
-    def search_difficulties(self, vector, top_k=3):
+    def search_difficulties(self, vector, top_k=3, ef_search=None, probes=None):
         """Search for similar difficulties by vector"""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                f"""
-                SELECT id, text,
-                       1 - (vector <=> %s::vector) as distance
-                FROM {DIFFICULTIES_COLLECTION_NAME}
-                ORDER BY vector <=> %s::vector
-                LIMIT %s
-                """,
-                (vector, vector, top_k)
-            )
+        with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in search_settings(ef_search, probes):
+                cur.execute(setting)
+            cur.execute(SEARCH_DIFFICULTIES_SQL, (vector, vector, top_k))
 
-            results = cur.fetchall()
+            return [difficulty_result(row) for row in cur.fetchall()]
 
-            return [{
-                "id": row[0],
-                "text": row[1],
-                "distance": float(row[2])
-            } for row in results]
 
-    def __del__(self):
-        if hasattr(self, 'conn'):
-            self.conn.close()
+class AsyncVectorStore:
+    """Awaitable VectorStore for code running on the event loop.
+
+    Queries go through the async connection pool (opened in the FastAPI
+    lifespan) and query embeddings through the async embedding client, so a
+    retrieval never blocks the loop while it waits on Ollama or Postgres.
+    """
+
+    def __init__(self, storage=VECTOR_STORAGE, pool=None, search_mode=SEARCH_MODE, use_cache=True) -> None:
+        self.storage = storage
+        self.search_mode = search_mode
+        self.embedding_model = get_embedding_service()
+        self.pool = pool or get_async_vector_pool()
+        self.cache = get_retrieval_cache() if use_cache else None
+
+    # Document search methods
+    async def search(self, query, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
+        """Search for documents by query string, see VectorStore.search"""
+        embedding = await self.embedding_model.aembed_query(query)
+        text = query if self.search_mode == "hybrid" else None
+        return await self.search_by_vector(embedding, top_k, partition, keywords, file_ids, ef_search, probes, text)
+
+    async def search_by_vector(self, embedding, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, text=None):
+        """Search for documents by query vector, see VectorStore.search_by_vector"""
+        scope = document_scope(self.storage, top_k, partition, keywords, file_ids, ef_search, probes, text is not None)
+        generation = self.cache.generation if self.cache else None
+        if self.cache and (results := self.cache.get(embedding, scope)) is not None:
+            return results
+
+        settings, sql, params = document_search(self.storage, embedding, top_k, partition, keywords, file_ids, ef_search, probes, text)
+
+        async with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in settings:
+                await cur.execute(setting)
+            await cur.execute(sql, params)
+
+            results = [document_result(row) for row in await cur.fetchall()]
+
+        if self.cache:
+            self.cache.put(embedding, scope, results, generation)
+        return results
+
+    async def search_many(self, queries, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
+        """Search for several query strings at once, see VectorStore.search_many"""
+        if not queries:
+            return []
+        embeddings = await self.embedding_model.aembed_documents(list(queries))
+        texts = list(queries) if self.search_mode == "hybrid" else None
+        return await self.search_many_by_vector(embeddings, top_k, partition, keywords, file_ids, ef_search, probes, texts)
+
+    async def search_many_by_vector(self, embeddings, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, texts=None):
+        """Search for several query vectors at once, see VectorStore.search_many_by_vector"""
+        scopes = [document_scope(self.storage, top_k, partition, keywords, file_ids, ef_search, probes, texts is not None)] * len(embeddings)
+        generation = self.cache.generation if self.cache else None
+        results = cached_results(self.cache, embeddings, scopes)
+        missing = [index for index, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        settings, sql, params = document_search_many(
+            self.storage,
+            [embeddings[index] for index in missing],
+            top_k, partition, keywords, file_ids, ef_search, probes,
+            [texts[index] for index in missing] if texts is not None else None
+        )
+
+        async with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in settings:
+                await cur.execute(setting)
+            await cur.execute(sql, params)
+
+            found = group_results(await cur.fetchall(), len(missing))
+
+        for index, result in zip(missing, found):
+            results[index] = result
+            if self.cache:
+                self.cache.put(embeddings[index], scopes[index], result, generation)
+        return results
+
+    async def corpus_version(self):
+        """Token identifying the set of ingested documents, see CORPUS_VERSION_SQL"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(CORPUS_VERSION_SQL)
+            return corpus_version(await cur.fetchone())
+
+    # Difficulty management methods
+    async def insert_difficulty(self, text, vector):
+        """Insert a difficulty with its vector into the difficulties collection"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(INSERT_DIFFICULTY_SQL, (vector, text))
+            difficulty_id = (await cur.fetchone())[0]
+
+        # The index check is cheap but synchronous, and builds run in the background anyway
+        await asyncio.to_thread(self.maybe_build_difficulties_index)
+        return difficulty_id
+
+    def maybe_build_difficulties_index(self):
+        with get_vector_pool().connection() as conn:
+            maybe_build_vector_index(conn, DIFFICULTIES_COLLECTION_NAME)
+
+    async def query_difficulties(self, limit=100):
+        """Query all difficulties from the database"""
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(QUERY_DIFFICULTIES_SQL, (limit,))
+            return [{"id": row[0], "text": row[1]} for row in await cur.fetchall()]
+
+    async def search_difficulties(self, vector, top_k=3, ef_search=None, probes=None):
+        """Search for similar difficulties by vector"""
+        async with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            for setting in search_settings(ef_search, probes):
+                await cur.execute(setting)
+            await cur.execute(SEARCH_DIFFICULTIES_SQL, (vector, vector, top_k))
+
+            return [difficulty_result(row) for row in await cur.fetchall()]
+
+
+def get_vector_store():
+    """Vector store of the configured VECTOR_STORE_BACKEND"""
+    if VECTOR_STORE_BACKEND == "numpy":
+        from numpy_vector_store import get_numpy_vector_store
+        return get_numpy_vector_store()
+    return VectorStore()
+
 
+def get_async_vector_store():
+    """Async vector store of the configured VECTOR_STORE_BACKEND"""
+    if VECTOR_STORE_BACKEND == "numpy":
+        from numpy_vector_store import AsyncNumpyVectorStore, get_numpy_vector_store
+        return AsyncNumpyVectorStore(get_numpy_vector_store())
+    return AsyncVectorStore()
@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from hashlib import sha256
+from os import getenv
+from threading import Lock
+from langchain_ollama import OllamaEmbeddings
+from connection_pools import get_vector_pool, get_async_vector_pool
+
+
+OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
+EMBEDDING_MODEL = getenv("EMBEDDING_MODEL")
+EMBEDDING_CACHE_TABLE = getenv("EMBEDDING_CACHE_TABLE", "embedding_cache")
+EMBEDDING_CACHE_SIZE = int(getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# The persistent layer lives in the vector database, which deployments on the
+# NumPy vector store backend may not run
+EMBEDDING_CACHE_PERSISTENT = bool(int(getenv(
+    "EMBEDDING_CACHE_PERSISTENT",
+    "0" if getenv("VECTOR_STORE_BACKEND") == "numpy" else "1"
+)))
+
+
+def text_hash(text):
+    return sha256(text.encode("utf-8")).hexdigest()
+
+
+def initialize_embedding_cache(conn):
+    """Create the persistent embedding cache table"""
+    with conn.cursor() as cur:
+        # Untyped vector column so vectors of any model/dimension can be cached
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {EMBEDDING_CACHE_TABLE} (
+                model TEXT NOT NULL,
+                text_hash CHAR(64) NOT NULL,
+                vector vector NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+
+
+class EmbeddingService:
+    """Embedding client shared by ingestion, document search and difficulties.
+
+    Lookups go through an in-process LRU first, then a Postgres table keyed
+    by (model, text hash), and only texts missing from both are sent to
+    Ollama. Results of the model are written back to both cache layers.
+    The a-prefixed methods do the same on the event loop, through the async
+    Ollama client and the async connection pool.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL, cache_size=EMBEDDING_CACHE_SIZE, pool=None, persistent=EMBEDDING_CACHE_PERSISTENT) -> None:
+        self.model = model
+        self.cache_size = cache_size
+        self.embedding_model = OllamaEmbeddings(model=model, base_url=OLLAMA_BASE_URL)
+
+        self.lock = Lock()
+        self.memory = OrderedDict()
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+
+        self.persistent = persistent
+        if persistent:
+            self.pool = pool or get_vector_pool()
+            with self.pool.connection() as conn:
+                initialize_embedding_cache(conn)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        keys = [text_hash(text) for text in texts]
+        vectors = self.memory_lookup(keys)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            stored = self.persistent_lookup(missing)
+            self.count("persistent_hits", len(stored))
+            self.remember(stored)
+            vectors.update(stored)
+
+        texts_by_key = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if texts_by_key:
+            self.count("misses", len(texts_by_key))
+            embeddings = self.embedding_model.embed_documents(list(texts_by_key.values()))
+            computed = dict(zip(texts_by_key.keys(), embeddings))
+            self.persist(computed)
+            self.remember(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts):
+        keys = [text_hash(text) for text in texts]
+        vectors = self.memory_lookup(keys)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            stored = await self.apersistent_lookup(missing)
+            self.count("persistent_hits", len(stored))
+            self.remember(stored)
+            vectors.update(stored)
+
+        texts_by_key = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if texts_by_key:
+            self.count("misses", len(texts_by_key))
+            embeddings = await self.embedding_model.aembed_documents(list(texts_by_key.values()))
+            computed = dict(zip(texts_by_key.keys(), embeddings))
+            await self.apersist(computed)
+            self.remember(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def memory_lookup(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                    self.counters["memory_hits"] += 1
+        return found
+
+    def remember(self, vectors):
+        with self.lock:
+            for key, vector in vectors.items():
+                self.memory[key] = vector
+                self.memory.move_to_end(key)
+            while len(self.memory) > self.cache_size:
+                self.memory.popitem(last=False)
+
+    def persistent_lookup(self, keys):
+        if not self.persistent:
+            return {}
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT text_hash, vector
+                FROM {EMBEDDING_CACHE_TABLE}
+                WHERE model = %s AND text_hash = ANY(%s)
+                """,
+                (self.model, keys)
+            )
+            return {row[0]: row[1].tolist() for row in cur.fetchall()}
+
+    def persist(self, vectors):
+        if not self.persistent:
+            return
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                f"""
+                INSERT INTO {EMBEDDING_CACHE_TABLE} (model, text_hash, vector)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (model, text_hash) DO NOTHING
+                """,
+                [(self.model, key, vector) for key, vector in vectors.items()]
+            )
+
+    async def apersistent_lookup(self, keys):
+        if not self.persistent:
+            return {}
+        async with get_async_vector_pool().connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT text_hash, vector
+                FROM {EMBEDDING_CACHE_TABLE}
+                WHERE model = %s AND text_hash = ANY(%s)
+                """,
+                (self.model, keys)
+            )
+            return {row[0]: row[1].tolist() for row in await cur.fetchall()}
+
+    async def apersist(self, vectors):
+        if not self.persistent:
+            return
+        async with get_async_vector_pool().connection() as conn, conn.cursor() as cur:
+            await cur.executemany(
+                f"""
+                INSERT INTO {EMBEDDING_CACHE_TABLE} (model, text_hash, vector)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (model, text_hash) DO NOTHING
+                """,
+                [(self.model, key, vector) for key, vector in vectors.items()]
+            )
+
+    def count(self, counter, amount):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters["memory_entries"] = len(self.memory)
+        lookups = counters["memory_hits"] + counters["persistent_hits"] + counters["misses"]
+        counters["hit_rate"] = (lookups - counters["misses"]) / lookups if lookups else 0.0
+        return counters
+
+
+embedding_service = None
+embedding_service_lock = Lock()
+
+
+def get_embedding_service():
+    """Return the process-wide EmbeddingService, creating it on first use"""
+    global embedding_service
+    with embedding_service_lock:
+        if embedding_service is None:
+            embedding_service = EmbeddingService()
+        return embedding_service
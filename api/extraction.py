@@ -0,0 +1,154 @@
+import pymupdf
+import time
+import unicodedata
+from io import BytesIO
+from os import getenv
+from unstructured.partition.auto import partition
+
+
+EXTRACTION_MIN_CHARS = int(getenv("EXTRACTION_MIN_CHARS", "200"))
+EXTRACTION_MAX_GARBAGE_RATIO = float(getenv("EXTRACTION_MAX_GARBAGE_RATIO", "0.1"))
+EXTRACTION_LANGUAGES = ["por", "eng"]
+
+
+def garbage_ratio(text):
+    """Fraction of non-whitespace characters that look like a broken text layer
+    (replacement characters, private-use glyphs, control characters)"""
+    visible = [char for char in text if not char.isspace()]
+    if not visible:
+        return 0.0
+
+    garbage = 0
+    for char in visible:
+        category = unicodedata.category(char)
+        if char == "\ufffd" or category in ("Co", "Cn", "Cc", "Cs"):
+            garbage += 1
+
+    return garbage / len(visible)
+
+
+def score_page(page, text):
+    """Score the PyMuPDF text layer of a page"""
+    chars = len(text.strip())
+    return {
+        "chars": chars,
+        "images": len(page.get_images()),
+        "garbage_ratio": garbage_ratio(text),
+    }
+
+
+def needs_fallback(score):
+    """A page goes to unstructured when its text layer is broken or when it
+    looks like a scanned image with little or no selectable text"""
+    if score["garbage_ratio"] > EXTRACTION_MAX_GARBAGE_RATIO:
+        return True
+    return score["images"] > 0 and score["chars"] < EXTRACTION_MIN_CHARS
+
+
+def partition_page(document, page_index):
+    """Run unstructured on a single page of the document"""
+    single_page = pymupdf.Document()
+    single_page.insert_pdf(document, from_page=page_index, to_page=page_index)
+    page_bytes = single_page.tobytes()
+    single_page.close()
+
+    elements = partition(file=BytesIO(page_bytes), content_type="application/pdf", languages=EXTRACTION_LANGUAGES)
+    return "\n".join(str(element) for element in elements)
+
+
+def open_document(source):
+    """Open a PDF from bytes or from a path on disk"""
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf.Document(stream=source)
+    return pymupdf.Document(source)
+
+
+def count_pages(source):
+    document = open_document(source)
+    try:
+        return document.page_count
+    finally:
+        document.close()
+
+
+def format_timing(timing):
+    """One log line for a page: its path and time, plus the text layer score
+    that sent it to unstructured"""
+    line = f"Page {timing['page']}: {timing['path']} in {timing['seconds']:.3f}s"
+    if timing["path"] != "pymupdf":
+        line += f" (chars={timing['chars']}, images={timing['images']}, garbage_ratio={timing['garbage_ratio']:.2f})"
+    return line
+
+
+def report_timings(timings):
+    """Log the path and time of every page, then a summary per path"""
+    if not timings:
+        return
+
+    for timing in sorted(timings, key=lambda timing: timing["page"]):
+        print(format_timing(timing))
+
+    by_path = {}
+    for timing in timings:
+        pages, seconds = by_path.get(timing["path"], (0, 0.0))
+        by_path[timing["path"]] = (pages + 1, seconds + timing["seconds"])
+
+    summary = ", ".join(f"{path}: {pages} pages in {seconds:.3f}s" for path, (pages, seconds) in by_path.items())
+    print(f"Extracted {len(timings)} pages ({summary})")
+
+
+def extract_page_range(path, start, stop):
+    """Extract pages [start, stop) of the PDF at path, returning
+    ([(page_number, text)], timings). Runs inside ingestion worker processes."""
+    extractor = PdfExtractor()
+    pages = list(extractor.iter_pages(path, start, stop, report=False))
+    return pages, extractor.timings
+
+
+class PdfExtractor:
+    """Cheap-first PDF text extraction.
+
+    Every page is read from the PyMuPDF text layer first. Only pages whose
+    text layer scores as scanned or broken are re-extracted with the much
+    slower unstructured partitioner. `timings` records which path each page
+    took and how long it spent there.
+    """
+
+    def __init__(self) -> None:
+        self.timings = []
+
+    def iter_pages(self, source, start=0, stop=None, report=True):
+        """Yield (page_number, text) for pages [start, stop) of the PDF given as bytes or path"""
+        self.timings = []
+        document = open_document(source)
+        try:
+            for page_index in range(start, document.page_count if stop is None else stop):
+                page = document[page_index]
+                yield page.number + 1, self.extract_page(document, page)
+        finally:
+            document.close()
+            if report:
+                report_timings(self.timings)
+
+    def extract_page(self, document, page):
+        start = time.perf_counter()
+        text = page.get_text()
+        score = score_page(page, text)
+        path = "pymupdf"
+
+        if needs_fallback(score):
+            try:
+                text = partition_page(document, page.number)
+                path = "unstructured"
+            except Exception as error:
+                print(f"Error while extracting page {page.number + 1} with unstructured: {error}")
+                path = "pymupdf (unstructured failed)"
+
+        self.timings.append({
+            "page": page.number + 1,
+            "path": path,
+            "seconds": time.perf_counter() - start,
+            **score,
+        })
+
+        return text
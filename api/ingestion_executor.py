@@ -0,0 +1,152 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count, getenv, remove
+from threading import Lock
+import time
+from data_processing import FileIngestion, INGESTION_BATCH_SIZE
+from extraction import count_pages, extract_page_range, report_timings
+
+
+INGESTION_WORKERS = int(getenv("INGESTION_WORKERS", str(cpu_count() or 1)))
+EXTRACTION_PAGES_PER_TASK = int(getenv("EXTRACTION_PAGES_PER_TASK", "8"))
+
+
+class ExtractionSchedule:
+    """Submits page-range extraction tasks for a list of files to the process
+    pool in file order, keeping at most `max_pending` tasks in flight.
+
+    While file N is being embedded and written, the pool is already
+    extracting the first pages of file N+1.
+    """
+
+    def __init__(self, pool, paths, max_pending) -> None:
+        self.pool = pool
+        self.max_pending = max_pending
+        self.lock = Lock()
+        self.tasks = deque()
+        self.futures = deque()
+        self.timings = {}
+        self.errors = {}
+
+        for index, path in enumerate(paths):
+            try:
+                page_count = count_pages(path)
+            except Exception as error:
+                self.errors[index] = error
+                continue
+            for start in range(0, page_count, EXTRACTION_PAGES_PER_TASK):
+                stop = min(start + EXTRACTION_PAGES_PER_TASK, page_count)
+                self.tasks.append((index, path, start, stop))
+        self.fill()
+
+    def fill(self):
+        with self.lock:
+            while self.tasks and len(self.futures) < self.max_pending:
+                index, path, start, stop = self.tasks.popleft()
+                self.futures.append((index, self.pool.submit(extract_page_range, path, start, stop)))
+
+    def next_future(self, index):
+        with self.lock:
+            if self.futures and self.futures[0][0] == index:
+                return self.futures.popleft()[1]
+        return None
+
+    def iter_pages(self, index):
+        """Yield (page_number, text) for the file at `index`, in page order"""
+        if index in self.errors:
+            raise self.errors[index]
+
+        timings = self.timings.setdefault(index, [])
+        while (future := self.next_future(index)) is not None:
+            self.fill()
+            pages, page_timings = future.result()
+            timings.extend(page_timings)
+            yield from pages
+        report_timings(timings)
+
+    def discard(self, index):
+        """Drop whatever is left of a file's tasks"""
+        with self.lock:
+            self.tasks = deque(task for task in self.tasks if task[0] != index)
+            remaining = deque()
+            for future_index, future in self.futures:
+                if future_index == index:
+                    future.cancel()
+                else:
+                    remaining.append((future_index, future))
+            self.futures = remaining
+        self.fill()
+
+
+class IngestionExecutor:
+    """Ingests many files using every core.
+
+    PDF extraction is CPU bound and fans out across a process pool in
+    page-range tasks, while embedding and database writes for the current
+    file run through the FileIngestion pipeline in this process, on pooled
+    connections.
+    """
+
+    def __init__(self, workers=INGESTION_WORKERS, batch_size=INGESTION_BATCH_SIZE) -> None:
+        self.workers = workers
+        # spawn rather than fork: the parent already runs threads and holds
+        # open database connections
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        self.ingestion = FileIngestion(batch_size=batch_size)
+        self.lock = Lock()
+        # Background jobs run one at a time, each one already using the whole pool
+        self.jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion-job")
+
+    def submit_job(self, job_id, files, job_store, remove_files=True):
+        """Run ingest_files for a job in the background, reporting to job_store.
+        The spooled files are removed once the job is done."""
+        return self.jobs.submit(self.run_job, job_id, files, job_store, remove_files)
+
+    def run_job(self, job_id, files, job_store, remove_files=True):
+        try:
+            job_store.start(job_id)
+            progress = lambda **counts: job_store.progress(job_id, **counts)
+            results = self.ingest_files(files, progress=progress)
+            job_store.finish(job_id, results)
+            return results
+        except Exception as error:
+            print(f"Ingestion job {job_id} failed: {error}")
+            job_store.fail(job_id, error)
+            raise
+        finally:
+            if remove_files:
+                for path, _, _ in files:
+                    remove(path)
+
+    def ingest_files(self, files, progress=None):
+        """Ingest [(path, filename, evaluation)] and return one result dict per file"""
+        with self.lock:
+            schedule = ExtractionSchedule(self.pool, [path for path, _, _ in files], max_pending=self.workers * 2)
+            results = []
+            start = time.perf_counter()
+
+            for index, (path, filename, evaluation) in enumerate(files):
+                try:
+                    file_id = self.ingestion.ingest(
+                        path,
+                        filename,
+                        evaluation=evaluation,
+                        pages=schedule.iter_pages(index),
+                        progress=progress
+                    )
+                    results.append({"filename": filename, "file_id": file_id, "error": None})
+                except Exception as error:
+                    print(f"Error ingesting {filename}: {error}")
+                    results.append({"filename": filename, "file_id": None, "error": str(error)})
+                finally:
+                    # Failed files and duplicates skipped by FileIngestion leave
+                    # their extraction tasks unconsumed
+                    schedule.discard(index)
+
+            print(f"Ingested {len(files)} files in {time.perf_counter() - start:.3f}s with {self.workers} workers")
+            return results
+
+    def shutdown(self):
+        self.jobs.shutdown(cancel_futures=True)
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,87 @@
+from os import getenv
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from connection_pools import get_vector_pool
+
+
+INGESTION_JOBS_TABLE = getenv("INGESTION_JOBS_TABLE", "ingestion_jobs")
+
+
+def initialize_ingestion_jobs(conn):
+    """Create the ingestion job status table"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {INGESTION_JOBS_TABLE} (
+                job_id VARCHAR(50) PRIMARY KEY,
+                status VARCHAR(20) NOT NULL,
+                files JSONB NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                rows_written INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+
+class IngestionJobs:
+    """Status and progress of ingestion jobs, kept in Postgres so any process
+    running the job can report on it"""
+
+    def __init__(self, pool=None) -> None:
+        self.pool = pool or get_vector_pool()
+        with self.pool.connection() as conn:
+            initialize_ingestion_jobs(conn)
+
+    def create(self, job_id, filenames):
+        files = [{"filename": filename, "file_id": None, "error": None} for filename in filenames]
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {INGESTION_JOBS_TABLE} (job_id, status, files)
+                VALUES (%s, 'queued', %s)
+                """,
+                (job_id, Jsonb(files))
+            )
+
+    def start(self, job_id):
+        # Retried jobs start counting from scratch
+        self.update(job_id, "status = 'running', pages = 0, chunks_embedded = 0, rows_written = 0, error = NULL")
+
+    def progress(self, job_id, pages=0, chunks=0, rows=0):
+        self.update(
+            job_id,
+            "pages = pages + %s, chunks_embedded = chunks_embedded + %s, rows_written = rows_written + %s",
+            (pages, chunks, rows)
+        )
+
+    def finish(self, job_id, results):
+        status = "failed" if any(result["error"] for result in results) else "completed"
+        self.update(job_id, "status = %s, files = %s", (status, Jsonb(results)))
+
+    def fail(self, job_id, error):
+        self.update(job_id, "status = 'failed', error = %s", (str(error),))
+
+    def update(self, job_id, assignments, params=()):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE {INGESTION_JOBS_TABLE}
+                SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = %s
+                """,
+                (*params, job_id)
+            )
+
+    def get(self, job_id):
+        with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                f"""
+                SELECT job_id, status, files, pages, chunks_embedded, rows_written, error, created_at, updated_at
+                FROM {INGESTION_JOBS_TABLE}
+                WHERE job_id = %s
+                """,
+                (job_id,)
+            )
+            return cur.fetchone()
@@ -0,0 +1,56 @@
+from os import getenv
+from pathlib import Path
+from threading import Lock
+import sys
+
+# The RabbitMQ client is shared with the evaluation system
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
+from rabbitmq_client import RabbitMQClient
+
+
+RABBITMQ_HOST = getenv("RABBITMQ_HOST", "localhost")
+RABBITMQ_PORT = int(getenv("RABBITMQ_PORT", "5672"))
+RABBITMQ_USER = getenv("RABBITMQ_USER", "guest")
+RABBITMQ_PASSWORD = getenv("RABBITMQ_PASSWORD", "guest")
+INGESTION_QUEUE_NAME = getenv("INGESTION_QUEUE_NAME", "ingestion_jobs")
+INGESTION_DEAD_LETTER_QUEUE_NAME = f"{INGESTION_QUEUE_NAME}.dead"
+INGESTION_MAX_RETRIES = int(getenv("INGESTION_MAX_RETRIES", "3"))
+
+
+def connect_ingestion_queue():
+    """Connect to RabbitMQ and declare the ingestion queue with its dead-letter queue"""
+    client = RabbitMQClient(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        user=RABBITMQ_USER,
+        password=RABBITMQ_PASSWORD
+    )
+    client.connect()
+    client.declare_queue(INGESTION_QUEUE_NAME, durable=True, dead_letter_queue=INGESTION_DEAD_LETTER_QUEUE_NAME)
+    return client
+
+
+class IngestionQueue:
+    """Hands ingestion jobs to ingestion workers over RabbitMQ.
+
+    Exposes the same submit_job as IngestionExecutor, but only publishes the
+    job: the spooled files must be on storage the workers can read.
+    """
+
+    def __init__(self) -> None:
+        self.client = connect_ingestion_queue()
+        # pika connections are not thread-safe
+        self.lock = Lock()
+
+    def submit_job(self, job_id, files, job_store=None):
+        message = {
+            "job_id": job_id,
+            "files": [{"path": path, "filename": filename, "evaluation": evaluation} for path, filename, evaluation in files]
+        }
+        with self.lock:
+            self.client.send_message(INGESTION_QUEUE_NAME, message, persistent=True)
+
+    def shutdown(self):
+        with self.lock:
+            self.client.close()
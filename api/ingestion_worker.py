@@ -0,0 +1,97 @@
+"""
+Ingestion worker: consumes ingestion jobs published by the API from RabbitMQ
+and runs them with an IngestionExecutor. Start as many workers, on as many
+machines, as needed; they only need the spooled files and the databases.
+
+    python ingestion_worker.py
+"""
+import os
+import signal
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from connection_pools import get_vector_pool
+from data_processing import initialize_vector_database
+from ingestion_executor import IngestionExecutor
+from ingestion_jobs import IngestionJobs
+from ingestion_queue import connect_ingestion_queue, INGESTION_QUEUE_NAME, INGESTION_MAX_RETRIES
+
+
+class IngestionWorker:
+    def __init__(self) -> None:
+        # Schema setup runs once here; jobs only borrow pooled connections
+        with get_vector_pool().connection() as conn:
+            initialize_vector_database(conn)
+        self.executor = IngestionExecutor()
+        self.jobs = IngestionJobs()
+        self.rabbitmq_client = None
+        self.stopping = False
+
+    def process_message(self, message):
+        job_id = message["job_id"]
+        files = [(file["path"], file["filename"], file["evaluation"]) for file in message["files"]]
+        print(f"Processing ingestion job {job_id} ({len(files)} files)")
+
+        # On retry, files completed by an earlier attempt are no-ops and files
+        # it left incomplete are ingested again (see FileIngestion.register_file)
+        results = self.executor.run_job(job_id, files, self.jobs, remove_files=False)
+        failed = [result["filename"] for result in results if result["error"]]
+        if failed:
+            raise Exception(f"Ingestion job {job_id} failed for {', '.join(failed)}")
+
+        for path, _, _ in files:
+            os.remove(path)
+        print(f"Ingestion job {job_id} completed")
+
+    def discard_message(self, message):
+        """Remove the spooled files of a job sent to the dead-letter queue"""
+        for file in message["files"]:
+            try:
+                os.remove(file["path"])
+            except FileNotFoundError:
+                pass
+        print(f"Ingestion job {message['job_id']} dead-lettered, spooled files removed")
+
+    def start(self):
+        def signal_handler(sig, frame):
+            if self.stopping:
+                # The job's message is redelivered, and the file it was
+                # ingesting is redone by the next attempt
+                print("\nStopping ingestion worker now...")
+                sys.exit(1)
+            self.stopping = True
+            print("\n\nStopping ingestion worker after the current job...")
+            if self.rabbitmq_client:
+                self.rabbitmq_client.request_stop()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        try:
+            print("Connecting to RabbitMQ...")
+            self.rabbitmq_client = connect_ingestion_queue()
+            if self.stopping:
+                # Signalled while connecting
+                self.rabbitmq_client.request_stop()
+
+            print(f"Starting to consume messages from '{INGESTION_QUEUE_NAME}'...")
+            self.rabbitmq_client.consume_messages(
+                INGESTION_QUEUE_NAME,
+                self.process_message,
+                max_retries=INGESTION_MAX_RETRIES,
+                long_running=True,
+                on_dead_letter=self.discard_message
+            )
+        except KeyboardInterrupt:
+            print("\nStopping ingestion worker...")
+        finally:
+            if self.rabbitmq_client:
+                self.rabbitmq_client.close()
+            self.executor.shutdown()
+            print("Ingestion worker stopped.")
+
+
+if __name__ == "__main__":
+    IngestionWorker().start()
@@ -1,10 +1,19 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 import uvicorn
+import os
+import shutil
+import tempfile
+from uuid import uuid4
 from models import AppContext, AskRequest
-from data_processing import FileIngestion
+from embeddings import get_embedding_service
+from connection_pools import get_vector_pool, open_async_pools, close_pools, pool_stats
+from data_processing import initialize_vector_database, VECTOR_STORE_BACKEND
+from retrieval_cache import get_retrieval_cache
+from speculative_retrieval import get_speculative_retrieval
 from dotenv import load_dotenv
 from os import getenv
 from agents.professor import ProfessorAgent
@@ -13,18 +22,30 @@ load_dotenv()
 
 API_PORT = int(getenv("API_PORT"))
 API_HOST = getenv("API_HOST")
+INGESTION_SPOOL_DIR = getenv("INGESTION_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "ingestion"))
 
 context = AppContext()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    context.build()
-
-    with ProfessorAgent.checkpointer() as checkpointer:
-        checkpointer.setup()
+    # Schema setup runs once here; requests only borrow pooled connections.
+    # The NumPy backend searches local files and takes no uploads, so it does
+    # not use the vector database.
+    vector_database = VECTOR_STORE_BACKEND != "numpy"
+    if vector_database:
+        with get_vector_pool().connection() as conn:
+            initialize_vector_database(conn)
+    await open_async_pools(vector=vector_database)
+    await ProfessorAgent.checkpointer().setup()
+
+    context.build(ingestion=vector_database)
 
     yield
 
+    if context.ingestion_backend:
+        context.ingestion_backend.shutdown()
+    await close_pools()
+
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -35,8 +56,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/ingest")
+def spool_upload(file):
+    """Copy an upload to INGESTION_SPOOL_DIR without loading it into memory"""
+    os.makedirs(INGESTION_SPOOL_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=INGESTION_SPOOL_DIR, suffix=".pdf", delete=False) as spooled_file:
+        shutil.copyfileobj(file.file, spooled_file, 1024 * 1024)
+    return spooled_file.name
+
+def discard_upload(job_id, paths, error):
+    """Remove the spooled files of a job that could not be submitted, and
+    mark the job failed if it was created"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if job_id is not None:
+        try:
+            context.ingestion_jobs.fail(job_id, error)
+        except Exception as fail_error:
+            print(f"Could not mark ingestion job {job_id} as failed: {fail_error}")
+
+def require_ingestion():
+    if context.ingestion_backend is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Uploads are not supported with VECTOR_STORE_BACKEND=numpy; add documents with scripts/build_numpy_store.py"
+        )
+
+@app.post("/ingest", status_code=202)
 async def ingest(files: list[UploadFile] = File(...)):
+    require_ingestion()
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
@@ -45,17 +95,40 @@ async def ingest(files: list[UploadFile] = File(...)):
         if content_type not in {"application/pdf", "application/x-pdf", "application/octet-stream"} and not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail=f"Unsupported file type for {file.filename}. Only PDF is allowed.")
 
-        file_bytes = await file.read()
-        file_ingestion = FileIngestion()
-        file_ingestion.ingest(file_bytes, file.filename)
-
-    return 200
+    ingestion_files = []
+    job_id = str(uuid4())
+    created = False
+    try:
+        for file in files:
+            path = await run_in_threadpool(spool_upload, file)
+            ingestion_files.append((path, file.filename, False))
+
+        # Extraction, embedding and writes run off the event loop, either in a
+        # background thread or on ingestion workers
+        await run_in_threadpool(context.ingestion_jobs.create, job_id, [file.filename for file in files])
+        created = True
+        await run_in_threadpool(context.ingestion_backend.submit_job, job_id, ingestion_files, context.ingestion_jobs)
+    except Exception as error:
+        # Nothing will ever pick up the spooled files
+        await run_in_threadpool(discard_upload, job_id if created else None, [path for path, _, _ in ingestion_files], error)
+        raise
+
+    return {"job_id": job_id}
+
+@app.get("/ingest/{job_id}")
+def retrieve_ingestion_job(job_id: str):
+    require_ingestion()
+    job = context.ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    return job
 
 
 @app.post("/ask_async")
 async def ask_professor_async(askRequest: AskRequest):
-    if not context.is_existent_conversation(askRequest.threadId):
-        context.create_title_for_conversation(askRequest.threadId, askRequest.question)
+    # Nothing here may block the event loop, or every open stream stalls
+    if not await run_in_threadpool(context.is_existent_conversation, askRequest.threadId):
+        await context.create_title_for_conversation(askRequest.threadId, askRequest.question)
 
     generator = context.professor.ainvoke_graph(askRequest.question, askRequest.threadId)
 
@@ -67,10 +140,23 @@ def retrieve_conversations():
     conversations = [{"threadId": doc["threadId"], "title": doc["title"], "timestamp": doc["timestamp"]} for doc in db_cursor]
     return conversations
 
+@app.get("/metrics")
+def retrieve_metrics():
+    # Only the Postgres stores cache results
+    retrieval_cache = get_retrieval_cache() if VECTOR_STORE_BACKEND != "numpy" else None
+    speculative_retrieval = get_speculative_retrieval()
+    return {
+        "embeddings": get_embedding_service().stats(),
+        "retrieval_cache": retrieval_cache.stats() if retrieval_cache else None,
+        "tools": context.professor.tools_node.stats(),
+        "speculative_retrieval": speculative_retrieval.stats() if speculative_retrieval else None,
+        "pools": pool_stats()
+    }
+
 @app.get("/conversation/{threadId}")
-def retrieve_conversation(threadId: str):
+async def retrieve_conversation(threadId: str):
     config = {"configurable": {"thread_id": threadId}}
-    return context.professor.get_conversation(config)
+    return await context.professor.get_conversation(config)
 
 
 
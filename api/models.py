@@ -3,25 +3,40 @@ from langchain_ollama import ChatOllama
 from pymongo import MongoClient
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 from os import getenv
 from agents.professor import ProfessorAgent
+from ingestion_jobs import IngestionJobs
 
 OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
 POSTGRES_URL = getenv("POSTGRES_URL")
 MONGO_URL = getenv("MONGO_URL")
 TITLE_GENERATION_MODEL = getenv("TITLE_GENERATION_MODEL")
+INGESTION_BACKEND = getenv("INGESTION_BACKEND", "local")
 
 class AppContext:
     def __init__(self):
         pass
 
-    def build(self):
+    def build(self, ingestion=True):
         self.title_generation_model = ChatOllama(model=TITLE_GENERATION_MODEL, base_url=OLLAMA_BASE_URL, reasoning=False)
 
         self.title_database_client = MongoClient(MONGO_URL)
         self.title_database = self.title_database_client["education"]
         self.title_database_collection = self.title_database["education_data"]
         self.professor = ProfessorAgent()
+        # Without ingestion, /ingest is rejected
+        self.ingestion_backend = self.build_ingestion_backend() if ingestion else None
+        self.ingestion_jobs = IngestionJobs() if ingestion else None
+
+    def build_ingestion_backend(self):
+        """Ingest in this process, or only enqueue jobs for ingestion workers"""
+        if INGESTION_BACKEND == "rabbitmq":
+            from ingestion_queue import IngestionQueue
+            return IngestionQueue()
+
+        from ingestion_executor import IngestionExecutor
+        return IngestionExecutor()
 
     def is_existent_conversation(self, thread_id):
         db_cursor = self.title_database_collection.find({"threadId": thread_id})
@@ -29,15 +44,18 @@ class AppContext:
 
         return len(mongo_documents) != 0        
 
-    def create_title_for_conversation(self, thread_id, question):
-        title_creation_response = self.title_generation_model.invoke([
+    async def create_title_for_conversation(self, thread_id, question):
+        title_creation_response = await self.title_generation_model.ainvoke([
             {"role": "system", "content": CONVERSATION_TITLE_PROMPT},
             {"role": "user", "content": question}
         ])
 
         title = title_creation_response.content
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.title_database_collection.insert_one({"threadId": thread_id, "title": title, "timestamp": timestamp})
+        await asyncio.to_thread(
+            self.title_database_collection.insert_one,
+            {"threadId": thread_id, "title": title, "timestamp": timestamp}
+        )
         print(f"Creating title for conversation: {title}")
 
 class AskRequest(BaseModel):
@@ -0,0 +1,316 @@
+from datetime import datetime
+from os import fsync, getenv, makedirs, path
+from threading import Lock
+import asyncio
+import json
+import numpy as np
+from data_processing import (
+    DIFFICULTIES_VECTOR_DIMENSION,
+    DOCUMENTS_VECTOR_DIMENSION,
+    SEARCH_PARTITION,
+    VECTOR_STORAGE,
+)
+from embeddings import get_embedding_service
+
+
+NUMPY_STORE_DIR = getenv("NUMPY_STORE_DIR", "vector_store")
+# Rows scored per block when the matrix is stored as float16, which NumPy
+# has no BLAS kernels for and upcasts to float32 block by block
+NUMPY_SCORE_BLOCK_ROWS = int(getenv("NUMPY_SCORE_BLOCK_ROWS", "65536"))
+
+
+def normalize(vectors):
+    """float32 rows scaled to unit length, so cosine similarity is a dot product"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class MemmapMatrix:
+    """Append-only matrix of unit vectors in a raw file on disk, memory-mapped
+    for reads, with one JSON metadata line per row in a sidecar file.
+
+    Appends write the vectors first and the metadata second; when a crash
+    leaves one file longer than the other, the extra rows are dropped on the
+    next load.
+    """
+
+    def __init__(self, directory, name, dimension, dtype=np.float32) -> None:
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = dimension * self.dtype.itemsize
+        self.vectors_path = path.join(directory, f"{name}.{self.dtype.name}")
+        self.metadata_path = path.join(directory, f"{name}.jsonl")
+        self.lock = Lock()
+        makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        metadata = []
+        if path.exists(self.metadata_path):
+            with open(self.metadata_path, encoding="utf-8") as metadata_file:
+                for line in metadata_file:
+                    if not line.endswith("\n"):
+                        break
+                    metadata.append(json.loads(line))
+        vector_rows = path.getsize(self.vectors_path) // self.row_bytes if path.exists(self.vectors_path) else 0
+
+        rows = min(len(metadata), vector_rows)
+        if path.exists(self.vectors_path) and path.getsize(self.vectors_path) != rows * self.row_bytes:
+            with open(self.vectors_path, "r+b") as vectors_file:
+                vectors_file.truncate(rows * self.row_bytes)
+        if len(metadata) != rows:
+            metadata = metadata[:rows]
+            with open(self.metadata_path, "w", encoding="utf-8") as metadata_file:
+                metadata_file.writelines(json.dumps(entry) + "\n" for entry in metadata)
+
+        self.metadata = metadata
+        self.remap()
+
+    def remap(self):
+        rows = len(self.metadata)
+        if rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dimension))
+        else:
+            self.matrix = np.empty((0, self.dimension), dtype=self.dtype)
+
+    def append(self, vectors, metadata):
+        vectors = normalize(vectors).astype(self.dtype)
+        if vectors.shape != (len(metadata), self.dimension):
+            raise ValueError(f"Expected {len(metadata)} vectors of dimension {self.dimension}, got {vectors.shape}")
+
+        with self.lock:
+            with open(self.vectors_path, "ab") as vectors_file:
+                vectors_file.write(vectors.tobytes())
+                vectors_file.flush()
+                fsync(vectors_file.fileno())
+            with open(self.metadata_path, "a", encoding="utf-8") as metadata_file:
+                metadata_file.writelines(json.dumps(entry) + "\n" for entry in metadata)
+            self.metadata = self.metadata + list(metadata)
+            self.remap()
+
+    def snapshot(self):
+        """(matrix, metadata) consistent with each other, safe to read while
+        other threads append"""
+        with self.lock:
+            return self.matrix, self.metadata
+
+    def scores(self, matrix, queries):
+        """(rows, queries) cosine similarities of unit-normalized `queries`"""
+        if self.dtype == np.float32:
+            return matrix @ queries.T
+        scores = np.empty((matrix.shape[0], queries.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], NUMPY_SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + NUMPY_SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + NUMPY_SCORE_BLOCK_ROWS] = block @ queries.T
+        return scores
+
+
+def top_k_rows(scores, top_k, mask=None):
+    """Indexes of the top_k highest scores, best first, among rows in mask"""
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+        available = int(mask.sum())
+    else:
+        available = scores.shape[0]
+    top_k = min(top_k, available)
+    if top_k <= 0:
+        return []
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class NumpyVectorStore:
+    """VectorStore backed by memory-mapped matrices on disk instead of Postgres.
+
+    Searches are exact: every query is scored against every row with one
+    matrix product, which is fast for the few thousand chunks of a single
+    course or a CI fixture. Same interface as VectorStore; ANN parameters
+    (ef_search, probes) are accepted and ignored, and search is vector only
+    (no hybrid mode). Vectors are kept as float16 when VECTOR_STORAGE is
+    "halfvec" and as float32 otherwise.
+    """
+
+    def __init__(self, directory=NUMPY_STORE_DIR, storage=VECTOR_STORAGE) -> None:
+        self.storage = storage
+        dtype = np.float16 if storage == "halfvec" else np.float32
+        self.embedding_model = get_embedding_service()
+        self.documents = MemmapMatrix(directory, "documents", DOCUMENTS_VECTOR_DIMENSION, dtype)
+        self.difficulties = MemmapMatrix(directory, "difficulties", DIFFICULTIES_VECTOR_DIMENSION, dtype)
+        # Serializes id assignment with the append that uses it
+        self.write_lock = Lock()
+        # "evaluation" keyword flag of each document row, extended under the
+        # documents lock (see document_snapshot)
+        self.evaluation_rows = np.zeros(0, dtype=bool)
+
+    # Document methods
+    def add_documents(self, documents, vectors):
+        """Append documents, dicts with text, file_id, filename, keywords and
+        page (and optionally start_index and token_count), with their
+        vectors. Returns the ids assigned to them, the store being the only
+        source of ids."""
+        with self.write_lock:
+            _, metadata = self.documents.snapshot()
+            next_id = max((entry["id"] for entry in metadata), default=0) + 1
+            entries = []
+            for document in documents:
+                entry = {
+                    "id": next_id,
+                    "text": document["text"],
+                    "file_id": document.get("file_id"),
+                    "filename": document.get("filename"),
+                    "keywords": list(document.get("keywords") or []),
+                    "page": document.get("page"),
+                    "start_index": document.get("start_index"),
+                    "token_count": document.get("token_count"),
+                }
+                next_id += 1
+                entries.append(entry)
+            self.documents.append(vectors, entries)
+        return [entry["id"] for entry in entries]
+
+    def search(self, query, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
+        """Search for documents by query string, see VectorStore.search"""
+        embedding = self.embedding_model.embed_query(query)
+        return self.search_by_vector(embedding, top_k, partition, keywords, file_ids)
+
+    def search_by_vector(self, embedding, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, text=None):
+        return self.search_many_by_vector([embedding], top_k, partition, keywords, file_ids)[0]
+
+    def search_many(self, queries, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None):
+        """Search for several query strings at once, see VectorStore.search_many"""
+        if not queries:
+            return []
+        embeddings = self.embedding_model.embed_documents(list(queries))
+        return self.search_many_by_vector(embeddings, top_k, partition, keywords, file_ids)
+
+    def search_many_by_vector(self, embeddings, top_k=3, partition=SEARCH_PARTITION, keywords=None, file_ids=None, ef_search=None, probes=None, texts=None):
+        matrix, metadata, evaluation = self.document_snapshot()
+        if not metadata:
+            return [[] for _ in embeddings]
+
+        scores = self.documents.scores(matrix, normalize(embeddings))
+        mask = self.document_mask(metadata, evaluation, partition, keywords, file_ids)
+        results = []
+        for query_index in range(scores.shape[1]):
+            query_scores = scores[:, query_index]
+            results.append([{
+                "id": metadata[row]["id"],
+                "text": metadata[row]["text"],
+                "file_id": metadata[row]["file_id"],
+                "keywords": metadata[row]["keywords"],
+                "page": metadata[row]["page"],
+                "start_index": metadata[row].get("start_index"),
+                "token_count": metadata[row].get("token_count"),
+                "distance": float(query_scores[row])
+            } for row in top_k_rows(query_scores, top_k, mask)])
+        return results
+
+    def document_mask(self, metadata, evaluation, partition=None, keywords=None, file_ids=None):
+        """Boolean row mask with the semantics of data_processing.document_filters"""
+        if not (partition or keywords or file_ids):
+            return None
+
+        mask = np.ones(len(metadata), dtype=bool)
+        if partition:
+            mask &= evaluation if partition == "evaluation" else ~evaluation
+        if keywords:
+            required = set(keywords)
+            mask &= np.fromiter((required.issubset(entry["keywords"]) for entry in metadata), dtype=bool, count=len(metadata))
+        if file_ids:
+            file_ids = set(file_ids)
+            mask &= np.fromiter((entry["file_id"] in file_ids for entry in metadata), dtype=bool, count=len(metadata))
+        return mask
+
+    def document_snapshot(self):
+        """(matrix, metadata, per-row "evaluation" keyword flags) of the
+        documents, consistent with each other. Rows are append-only, so only
+        the rows added since the last call are inspected for the flags."""
+        with self.documents.lock:
+            matrix, metadata = self.documents.matrix, self.documents.metadata
+            flags = self.evaluation_rows
+            if len(flags) < len(metadata):
+                added = np.fromiter(
+                    ("evaluation" in entry["keywords"] for entry in metadata[len(flags):]),
+                    dtype=bool,
+                    count=len(metadata) - len(flags)
+                )
+                flags = np.concatenate([flags, added])
+                self.evaluation_rows = flags
+            return matrix, metadata, flags[:len(metadata)]
+
+    # Difficulty management methods
+    def corpus_version(self):
+        """Token identifying the stored documents; the store is append-only,
+        so the row count is enough"""
+        _, metadata = self.documents.snapshot()
+        return f"numpy:{len(metadata)}"
+
+    def insert_difficulty(self, text, vector):
+        with self.write_lock:
+            _, metadata = self.difficulties.snapshot()
+            difficulty_id = len(metadata) + 1
+            created_at = datetime.now().isoformat()
+            self.difficulties.append([vector], [{"id": difficulty_id, "text": text, "created_at": created_at}])
+        return difficulty_id
+
+    def query_difficulties(self, limit=100):
+        _, metadata = self.difficulties.snapshot()
+        return [{"id": entry["id"], "text": entry["text"]} for entry in reversed(metadata[-limit:])]
+
+    def search_difficulties(self, vector, top_k=3, ef_search=None, probes=None):
+        matrix, metadata = self.difficulties.snapshot()
+        if not metadata:
+            return []
+        scores = self.difficulties.scores(matrix, normalize(vector))[:, 0]
+        return [{
+            "id": metadata[row]["id"],
+            "text": metadata[row]["text"],
+            "distance": float(scores[row])
+        } for row in top_k_rows(scores, top_k)]
+
+
+class AsyncNumpyVectorStore:
+    """AsyncVectorStore interface over a NumpyVectorStore. Embedding requests
+    and matrix products run in worker threads, off the event loop."""
+
+    def __init__(self, store) -> None:
+        self.store = store
+
+    async def search(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.search, *args, **kwargs)
+
+    async def search_by_vector(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.search_by_vector, *args, **kwargs)
+
+    async def search_many(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.search_many, *args, **kwargs)
+
+    async def search_many_by_vector(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.search_many_by_vector, *args, **kwargs)
+
+    async def corpus_version(self):
+        return await asyncio.to_thread(self.store.corpus_version)
+
+    async def insert_difficulty(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.insert_difficulty, *args, **kwargs)
+
+    async def query_difficulties(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.query_difficulties, *args, **kwargs)
+
+    async def search_difficulties(self, *args, **kwargs):
+        return await asyncio.to_thread(self.store.search_difficulties, *args, **kwargs)
+
+
+numpy_vector_store = None
+numpy_vector_store_lock = Lock()
+
+
+def get_numpy_vector_store():
+    """Return the process-wide NumpyVectorStore, loading it on first use"""
+    global numpy_vector_store
+    with numpy_vector_store_lock:
+        if numpy_vector_store is None:
+            numpy_vector_store = NumpyVectorStore()
+        return numpy_vector_store
@@ -105,4 +105,13 @@ You must ensure that:
 
 Do not fabricate facts — only use information that can be reasonably inferred from the context.  
 Focus on producing educationally valuable questions that help a university student understand and apply the material.
-"""
\ No newline at end of file
+"""
+CONVERSATION_SUMMARY_PROMPT = """
+You maintain a running summary of a tutoring conversation between a student and a professor.
+You receive the current summary (possibly empty) and the next part of the conversation. Return the updated summary.
+- Keep the topics the student asked about, the explanations and conclusions given, the student's difficulties, and any open questions or follow-ups.
+- Keep names, definitions, formulas and numbers exactly as stated.
+- Do not include retrieved document text, greetings or filler.
+- Write in the language of the conversation, in at most 250 words.
+Output only the summary, nothing else.
+"""
@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from os import getenv
+from threading import Lock, Thread
+import time
+import numpy as np
+import psycopg
+from connection_pools import get_vector_pool
+
+
+VECTOR_DB_URL = getenv("VECTOR_DB_URL")
+DOCUMENTS_COLLECTION_NAME = getenv("DOCUMENTS_COLLECTION_NAME")
+# Cached searches; 0 disables the cache
+RETRIEVAL_CACHE_SIZE = int(getenv("RETRIEVAL_CACHE_SIZE", "512"))
+RETRIEVAL_CACHE_TTL = float(getenv("RETRIEVAL_CACHE_TTL", "600"))
+# Cosine similarity above which two query embeddings share their results
+RETRIEVAL_CACHE_THRESHOLD = float(getenv("RETRIEVAL_CACHE_THRESHOLD", "0.95"))
+# Postgres channel notified with a file_id whenever a file's documents change
+DOCUMENTS_CHANGED_CHANNEL = getenv("DOCUMENTS_CHANGED_CHANNEL", "documents_changed")
+
+
+def unit_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def search_scope(top_k, partition=None, keywords=None, file_ids=None, **settings):
+    """Everything besides the query vector that determines a search's results"""
+    return (
+        top_k,
+        partition,
+        frozenset(keywords or ()),
+        frozenset(file_ids or ()),
+        tuple(sorted(settings.items())),
+    )
+
+
+def in_scope(scope, file_id, file_keywords):
+    """Whether documents of a file with these keywords can appear in results of scope"""
+    _, partition, keywords, file_ids, _ = scope
+    if partition == "evaluation" and "evaluation" not in file_keywords:
+        return False
+    if partition == "production" and "evaluation" in file_keywords:
+        return False
+    if not keywords.issubset(file_keywords):
+        return False
+    return not file_ids or file_id in file_ids
+
+
+class RetrievalCache:
+    """Semantic cache of document search results.
+
+    A search is served from the cache when an earlier search with the same
+    scope (top_k, filters and search settings) had a query embedding within
+    RETRIEVAL_CACHE_THRESHOLD cosine similarity of the new one. Entries
+    expire after RETRIEVAL_CACHE_TTL seconds, the least recently used are
+    evicted past RETRIEVAL_CACHE_SIZE, and entries a changed file could
+    affect are dropped (see invalidate_file).
+
+    Every invalidation bumps `generation`. Callers read it before searching
+    and pass it to put, which drops results of a search that overlapped an
+    invalidation, as they may predate the change.
+    """
+
+    def __init__(self, size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL, threshold=RETRIEVAL_CACHE_THRESHOLD) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = Lock()
+        # entry id -> (scope, unit query vector, results, expires_at)
+        self.entries = OrderedDict()
+        self.next_id = 0
+        self.generation = 0
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "expirations": 0, "stale_puts": 0}
+
+    def get(self, embedding, scope):
+        """Cached results of the closest matching search, or None"""
+        vector = unit_vector(embedding)
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            candidates = [(entry_id, entry) for entry_id, entry in self.entries.items() if entry[0] == scope]
+            if candidates:
+                similarities = np.stack([entry[1] for _, entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self.entries.move_to_end(entry_id)
+                    self.counters["hits"] += 1
+                    return list(entry[2])
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, embedding, scope, results, generation):
+        """Cache the results of a search started at `generation`"""
+        with self.lock:
+            if generation != self.generation:
+                self.counters["stale_puts"] += 1
+                return
+            self.entries[self.next_id] = (scope, unit_vector(embedding), list(results), time.monotonic() + self.ttl)
+            self.next_id += 1
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def expire(self, now):
+        expired = [entry_id for entry_id, entry in self.entries.items() if entry[3] <= now]
+        for entry_id in expired:
+            del self.entries[entry_id]
+        self.counters["expirations"] += len(expired)
+
+    def invalidate_file(self, file_id, file_keywords=None, vectors=()):
+        """Drop the entries a change to file_id's documents can affect: those
+        whose results include the file, and, for the file's current
+        `vectors`, those in scope where one of them would now rank within
+        top_k. Hybrid searches in scope are always dropped, as their lexical
+        ranking can change too."""
+        vectors = np.stack([unit_vector(vector) for vector in vectors]) if len(vectors) else None
+        with self.lock:
+            self.generation += 1
+            stale = []
+            for entry_id, (scope, query_vector, results, _) in self.entries.items():
+                if any(result["file_id"] == file_id for result in results):
+                    stale.append(entry_id)
+                elif vectors is not None and in_scope(scope, file_id, file_keywords or []):
+                    settings = dict(scope[4])
+                    if settings.get("text") or len(results) < scope[0]:
+                        stale.append(entry_id)
+                    elif float(np.max(vectors @ query_vector)) >= min(result["distance"] for result in results):
+                        stale.append(entry_id)
+            for entry_id in stale:
+                del self.entries[entry_id]
+            self.counters["invalidations"] += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.counters["invalidations"] += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters["entries"] = len(self.entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+def notify_documents_changed(conn, file_id):
+    """Tell every process caching search results that file_id changed"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_notify(%s, %s)", (DOCUMENTS_CHANGED_CHANNEL, file_id))
+
+
+def file_vectors(file_id):
+    """(keywords, vectors) of the documents currently stored for a file"""
+    with get_vector_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT keywords, COALESCE(vector, vector_half::vector)
+            FROM {DOCUMENTS_COLLECTION_NAME}
+            WHERE file_id = %s
+            """,
+            (file_id,)
+        )
+        rows = cur.fetchall()
+    keywords = rows[0][0] if rows else []
+    return keywords or [], [row[1] for row in rows if row[1] is not None]
+
+
+def listen_for_changes(cache):
+    """Invalidate cache entries on DOCUMENTS_CHANGED_CHANNEL notifications,
+    from this process or any ingestion worker"""
+    while True:
+        try:
+            with psycopg.connect(VECTOR_DB_URL, autocommit=True) as conn:
+                conn.execute(f"LISTEN {DOCUMENTS_CHANGED_CHANNEL}")
+                # Changes made while nobody was listening cannot be traced
+                cache.clear()
+                for notify in conn.notifies():
+                    keywords, vectors = file_vectors(notify.payload)
+                    cache.invalidate_file(notify.payload, keywords, vectors)
+        except Exception as error:
+            print(f"Retrieval cache listener error, reconnecting: {error}")
+            cache.clear()
+            time.sleep(5)
+
+
+retrieval_cache = None
+retrieval_cache_lock = Lock()
+
+
+def get_retrieval_cache():
+    """Return the process-wide RetrievalCache, or None when it is disabled.
+    The first call starts the thread listening for document changes."""
+    global retrieval_cache
+    if RETRIEVAL_CACHE_SIZE <= 0:
+        return None
+    with retrieval_cache_lock:
+        if retrieval_cache is None:
+            retrieval_cache = RetrievalCache()
+            Thread(target=listen_for_changes, args=(retrieval_cache,), name="retrieval-cache-listener", daemon=True).start()
+        return retrieval_cache
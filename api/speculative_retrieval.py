@@ -0,0 +1,139 @@
+from os import getenv
+import asyncio
+import time
+import numpy as np
+from data_processing import get_async_vector_store
+from embeddings import get_embedding_service
+
+
+# Start a document search for every question before the model asks for one
+SPECULATIVE_RETRIEVAL = bool(int(getenv("SPECULATIVE_RETRIEVAL", "0")))
+# Cosine similarity a search_documents query needs with the question to be
+# served the prefetched results
+SPECULATIVE_RETRIEVAL_THRESHOLD = float(getenv("SPECULATIVE_RETRIEVAL_THRESHOLD", "0.85"))
+
+
+def cosine_similarity(first, second):
+    first = np.asarray(first, dtype=np.float32)
+    second = np.asarray(second, dtype=np.float32)
+    norms = np.linalg.norm(first) * np.linalg.norm(second)
+    return float(first @ second / norms) if norms else 0.0
+
+
+class Prefetch:
+    """A document search for a question, running in the background. The
+    question is embedded in a task of its own, so a search_documents query
+    can be compared with it before the search finishes."""
+
+    def __init__(self, question, top_k) -> None:
+        self.question = question
+        self.top_k = top_k
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.used = False
+        self.embedding = asyncio.create_task(get_embedding_service().aembed_query(question))
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """Documents for the question"""
+        await self.embedding
+        # search embeds the question again; this is an embedding cache hit
+        documents = await get_async_vector_store().search(self.question, top_k=self.top_k)
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        return documents
+
+
+class SpeculativeRetrieval:
+    """Per-thread registry of prefetched document searches.
+
+    ProfessorAgent starts a prefetch for the student's question when a turn
+    begins, so the search runs while the model decides whether to call
+    search_documents. When it does, with a query whose embedding is within
+    `threshold` of the question's, the tool is served the prefetched
+    documents instead of searching again. Entries live for one turn and
+    belong to the event loop they were started on.
+    """
+
+    def __init__(self, threshold=SPECULATIVE_RETRIEVAL_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.prefetches = {}
+        self.counters = {"prefetches": 0, "hits": 0, "misses": 0, "unused": 0, "errors": 0, "saved_ms": 0.0}
+
+    def start(self, thread_id, question, top_k):
+        self.finish(thread_id)
+        self.prefetches[thread_id] = Prefetch(question, top_k)
+        self.counters["prefetches"] += 1
+
+    async def take(self, thread_id, query, top_k):
+        """Prefetched documents for a search_documents call, or None when
+        there is no matching prefetch for the thread. The search is only
+        awaited once the query is known to match the question."""
+        prefetch = self.prefetches.get(thread_id)
+        if prefetch is None or prefetch.top_k != top_k:
+            return None
+
+        try:
+            # Shielded: a tool call timing out must not cancel the prefetch
+            query_embedding, embedding = await asyncio.gather(
+                get_embedding_service().aembed_query(query),
+                asyncio.shield(prefetch.embedding)
+            )
+        except Exception as error:
+            # Counted in finish
+            print(f"Speculative retrieval failed: {error!r}")
+            return None
+        if cosine_similarity(query_embedding, embedding) < self.threshold:
+            self.counters["misses"] += 1
+            return None
+
+        start = time.perf_counter()
+        try:
+            documents = await asyncio.shield(prefetch.task)
+        except Exception as error:
+            print(f"Speculative retrieval failed: {error!r}")
+            return None
+        waited = (time.perf_counter() - start) * 1000
+
+        self.counters["hits"] += 1
+        # The search the tool would have run, minus the time spent waiting
+        # for the prefetch to finish
+        self.counters["saved_ms"] += max(prefetch.duration_ms - waited, 0.0)
+        prefetch.used = True
+        return documents
+
+    def finish(self, thread_id):
+        """Drop the thread's prefetch at the end of its turn"""
+        prefetch = self.prefetches.pop(thread_id, None)
+        if prefetch is None:
+            return
+        if not prefetch.embedding.done():
+            prefetch.embedding.cancel()
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+        elif not prefetch.task.cancelled() and prefetch.task.exception() is not None:
+            # Retrieving the exception also keeps asyncio from logging it
+            self.counters["errors"] += 1
+        if not prefetch.used:
+            self.counters["unused"] += 1
+
+    def stats(self):
+        counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["active"] = len(self.prefetches)
+        return counters
+
+
+speculative_retrieval = None
+
+
+def get_speculative_retrieval():
+    """Return the process-wide SpeculativeRetrieval, or None when
+    SPECULATIVE_RETRIEVAL is off. Only used from the event loop, so it needs
+    no lock."""
+    global speculative_retrieval
+    if not SPECULATIVE_RETRIEVAL:
+        return None
+    if speculative_retrieval is None:
+        speculative_retrieval = SpeculativeRetrieval()
+    return speculative_retrieval
@@ -10,10 +10,12 @@ os.environ["DIFFICULTIES_VECTOR_DIMENSION"]="1024"
 os.environ["DIFFICULTIES_COLLECTION_NAME"]="difficulties_collection"
 os.environ["EVALUATION"]="0"  # Disable evaluation mode filtering
 
-from data_processing import VectorStore
+# VECTOR_STORE_BACKEND=numpy searches a store built by
+# scripts/build_numpy_store.py instead of the database
+from data_processing import get_vector_store
 
 if __name__ == "__main__":
-    store = VectorStore()
+    store = get_vector_store()
     results = store.search("application layer")
     print(len(results))
     print(results)
@@ -1,42 +1,74 @@
 from typing import Annotated
-from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool, tool
 from langchain_core.messages import ToolMessage
-from langchain_ollama import OllamaEmbeddings
 from agents.question_generator import QuestionGeneratorAgent
 from os import getenv
-from data_processing import VectorStore
+from data_processing import get_async_vector_store, get_vector_store
+from context_packing import pack_context
+from speculative_retrieval import get_speculative_retrieval
+from embeddings import get_embedding_service
 from uuid import uuid4
 import json
 
-OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL")
-EMBEDDING_MODEL = getenv("EMBEDDING_MODEL")
 DIFFICULTIES_COLLECTION_NAME = getenv("DIFFICULTIES_COLLECTION_NAME")
+SEARCH_DOCUMENTS_TOP_K = 6
 
 
-@tool
-def register_difficulty(
+# Tools that touch the vector database have a sync implementation and an
+# async one (used by ainvoke), so graph nodes on the event loop never block it
+
+
+def register_difficulty_sync(
         description: Annotated[str, "A brief description of the difficulty"]
     ):
-    """Register a student's difficulty"""
     print("[X] Register difficulties called")
-    vector_store = VectorStore()
-    embedding_model = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
-
-    embedding = embedding_model.embed_query(description)
+    vector_store = get_vector_store()
+    embedding = get_embedding_service().embed_query(description)
 
     difficulty_id = vector_store.insert_difficulty(description, embedding)
 
     return ToolMessage(content=f"Difficulty saved in the database. Id: {difficulty_id}", tool_call_id="123")
 
-@tool
-def retrieve_difficulties():
-    """Retrieve the difficulties of the student"""
+async def register_difficulty_async(
+        description: Annotated[str, "A brief description of the difficulty"]
+    ):
+    print("[X] Register difficulties called")
+    vector_store = get_async_vector_store()
+    embedding = await get_embedding_service().aembed_query(description)
+
+    difficulty_id = await vector_store.insert_difficulty(description, embedding)
+
+    return ToolMessage(content=f"Difficulty saved in the database. Id: {difficulty_id}", tool_call_id="123")
+
+register_difficulty = StructuredTool.from_function(
+    func=register_difficulty_sync,
+    coroutine=register_difficulty_async,
+    name="register_difficulty",
+    description="Register a student's difficulty"
+)
+
+def retrieve_difficulties_sync():
     print("[X] Retrieve difficulties called")
-    vector_store = VectorStore()
+    vector_store = get_vector_store()
     difficulties = vector_store.query_difficulties(limit=100)
 
     return difficulties
 
+async def retrieve_difficulties_async():
+    print("[X] Retrieve difficulties called")
+    vector_store = get_async_vector_store()
+    difficulties = await vector_store.query_difficulties(limit=100)
+
+    return difficulties
+
+retrieve_difficulties = StructuredTool.from_function(
+    func=retrieve_difficulties_sync,
+    coroutine=retrieve_difficulties_async,
+    name="retrieve_difficulties",
+    description="Retrieve the difficulties of the student"
+)
+
 @tool
 def generate_study_questions(
     topic: Annotated[str, "The topic, concept, or subject area the questions should focus on."]
@@ -53,15 +85,10 @@ def generate_study_questions(
 
     return tool_response
 
-@tool
-def search_documents(query: Annotated[str, "The topic, concept, or subject that should be searched in the documents"]):
-    """Search for relevant documents in the database"""
-    print(f"[Tool Call] search_documents(topic={query})")
-    vector_store = VectorStore()
-    documents = vector_store.search(query, top_k=6)
-
+def format_documents(documents):
+    """Tool output for search results, packed into the context token budget"""
     tool_response = []
-    for document in documents:
+    for document in pack_context(documents):
         piece_id = str(uuid4()).split("-")[0]
         document_json = {
             "piece_id": piece_id,
@@ -69,4 +96,35 @@ def search_documents(query: Annotated[str, "The topic, concept, or subject that
             "content": document["text"]
         }
         tool_response.append(document_json)
-    return json.dumps(tool_response)
\ No newline at end of file
+    return json.dumps(tool_response)
+
+def search_documents_sync(query: Annotated[str, "The topic, concept, or subject that should be searched in the documents"]):
+    print(f"[Tool Call] search_documents(topic={query})")
+    vector_store = get_vector_store()
+    documents = vector_store.search(query, top_k=SEARCH_DOCUMENTS_TOP_K)
+
+    return format_documents(documents)
+
+async def search_documents_async(
+        query: Annotated[str, "The topic, concept, or subject that should be searched in the documents"],
+        config: RunnableConfig
+    ):
+    print(f"[Tool Call] search_documents(topic={query})")
+    # Served from the search started for the student's question, when the
+    # professor graph prefetched one for this thread and the query matches
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if (prefetcher := get_speculative_retrieval()) and thread_id:
+        if (documents := await prefetcher.take(thread_id, query, SEARCH_DOCUMENTS_TOP_K)) is not None:
+            return format_documents(documents)
+
+    vector_store = get_async_vector_store()
+    documents = await vector_store.search(query, top_k=SEARCH_DOCUMENTS_TOP_K)
+
+    return format_documents(documents)
+
+search_documents = StructuredTool.from_function(
+    func=search_documents_sync,
+    coroutine=search_documents_async,
+    name="search_documents",
+    description="Search for relevant documents in the database"
+)
@@ -0,0 +1,245 @@
+from os import getenv
+from threading import Thread
+from math import sqrt
+import psycopg
+import time
+
+
+VECTOR_DB_URL = getenv("VECTOR_DB_URL")
+VECTOR_INDEX_TYPE = getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_INDEX_MIN_ROWS = int(getenv("VECTOR_INDEX_MIN_ROWS", "10000"))
+VECTOR_INDEX_MAINTENANCE_WORK_MEM = getenv("VECTOR_INDEX_MAINTENANCE_WORK_MEM")
+HNSW_M = int(getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_LISTS = int(getenv("IVFFLAT_LISTS", "0"))
+IVFFLAT_PROBES = int(getenv("IVFFLAT_PROBES", "10"))
+HNSW_ITERATIVE_SCAN = getenv("HNSW_ITERATIVE_SCAN", "strict_order")
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+
+# Documents are searched either as evaluation data or as production data,
+# never both. Each partition gets its own partial ANN index, and searches
+# inline the same predicate so the planner can match it to that index.
+DOCUMENT_PARTITIONS = {
+    "evaluation": "keywords @> ARRAY['evaluation']::text[]",
+    "production": "NOT (keywords @> ARRAY['evaluation']::text[])",
+}
+
+
+# How vectors are stored and indexed: float32 `vector`, float16 `vector_half`
+# (half the size), or float32 kept on disk with a binary-quantized index
+# (1 bit per dimension) whose candidates are re-ranked exactly
+STORAGE_MODES = ("vector", "halfvec", "binary")
+
+
+def storage_expression(storage="vector", dimension=None):
+    """(indexed expression, operator class) of a storage mode"""
+    if storage == "halfvec":
+        return "vector_half", "halfvec_cosine_ops"
+    if storage == "binary":
+        return f"(binary_quantize(vector)::bit({dimension}))", "bit_hamming_ops"
+    return "vector", "vector_cosine_ops"
+
+
+def index_name(table, partition=None, index_type=VECTOR_INDEX_TYPE, storage="vector"):
+    if partition:
+        return f"{table}_{storage}_{index_type}_{partition}_idx"
+    return f"{table}_{storage}_{index_type}_idx"
+
+
+def ivfflat_lists(rows):
+    """pgvector's guideline: rows / 1000 up to 1M rows, sqrt(rows) above"""
+    if IVFFLAT_LISTS > 0:
+        return IVFFLAT_LISTS
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(sqrt(rows))
+
+
+def index_definition(table, name, index_type=VECTOR_INDEX_TYPE, rows=0, where=None, storage="vector", dimension=None):
+    if index_type == "hnsw":
+        parameters = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    elif index_type == "ivfflat":
+        parameters = f"lists = {ivfflat_lists(rows)}"
+    else:
+        raise ValueError(f"Unknown vector index type: {index_type}")
+
+    expression, opclass = storage_expression(storage, dimension)
+    return f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON {table} USING {index_type} ({expression} {opclass})
+        WITH ({parameters})
+        {f"WHERE {where}" if where else ""}
+    """
+
+
+def search_settings(ef_search=None, probes=None, filtered=False):
+    """SET LOCAL statements tuning the ANN index scan of the current transaction.
+
+    Filters that no partial index covers are applied after the index scan;
+    with `filtered`, HNSW keeps scanning until enough rows pass the filter
+    (pgvector >= 0.8 iterative scans) instead of returning too few.
+    """
+    settings = [
+        f"SET LOCAL hnsw.ef_search = {int(ef_search or HNSW_EF_SEARCH)}",
+        f"SET LOCAL ivfflat.probes = {int(probes or IVFFLAT_PROBES)}",
+    ]
+    if filtered and HNSW_ITERATIVE_SCAN != "off":
+        settings.append(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}")
+    return settings
+
+
+def estimated_rows(conn, table, where=None):
+    if where:
+        # Planner estimate for the partition, without scanning it
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} WHERE {where}")
+            return int(cur.fetchone()[0][0]["Plan"]["Plan Rows"])
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (table,))
+        rows = cur.fetchone()[0]
+        if rows < 0:
+            # Never analyzed
+            cur.execute(f"SELECT count(*) FROM {table}")
+            rows = cur.fetchone()[0]
+        return rows
+
+
+def vector_indexes(conn, table):
+    """[(name, index_type, valid, definition)] of the ANN indexes on a table"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT index_class.relname, access_method.amname, pg_index.indisvalid,
+                   pg_get_indexdef(pg_index.indexrelid)
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            JOIN pg_am access_method ON access_method.oid = index_class.relam
+            WHERE pg_index.indrelid = %s::regclass AND access_method.amname = ANY(%s)
+            ORDER BY index_class.relname
+            """,
+            (table, list(INDEX_TYPES))
+        )
+        return cur.fetchall()
+
+
+def try_lock(conn, name):
+    """Advisory lock so only one process builds a given index at a time"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (name,))
+        return cur.fetchone()[0]
+
+
+def unlock(conn, name):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+
+
+def build_index(conn, table, name, index_type=VECTOR_INDEX_TYPE, where=None, storage="vector", dimension=None):
+    """CREATE INDEX CONCURRENTLY; conn must be in autocommit mode"""
+    rows = estimated_rows(conn, table, where)
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        if VECTOR_INDEX_MAINTENANCE_WORK_MEM:
+            cur.execute(f"SET maintenance_work_mem = '{VECTOR_INDEX_MAINTENANCE_WORK_MEM}'")
+        cur.execute(index_definition(table, name, index_type, rows, where, storage, dimension))
+    print(f"Built {index_type} index {name} over ~{rows} rows in {time.perf_counter() - start:.1f}s")
+
+
+def needs_vector_index(conn, table, partition=None, where=None, storage="vector"):
+    """True when the configured index is missing (or invalid) and the table,
+    or the partition selected by `where`, has passed VECTOR_INDEX_MIN_ROWS"""
+    if VECTOR_INDEX_TYPE not in INDEX_TYPES:
+        return False
+    name = index_name(table, partition, storage=storage)
+    if any(existing_name == name and valid for existing_name, _, valid, _ in vector_indexes(conn, table)):
+        return False
+    return estimated_rows(conn, table, where) >= VECTOR_INDEX_MIN_ROWS
+
+
+def ensure_vector_index(conn, table, partition=None, where=None, storage="vector", dimension=None):
+    """Build the configured ANN index if the table needs it, returning True if
+    it was built here. An invalid index left behind by an interrupted
+    concurrent build is dropped and rebuilt."""
+    if not needs_vector_index(conn, table, partition, where, storage):
+        return False
+
+    name = index_name(table, partition, storage=storage)
+    if not try_lock(conn, name):
+        return False
+    try:
+        # Another process may have finished the build while we waited
+        if not needs_vector_index(conn, table, partition, where, storage):
+            return False
+        with conn.cursor() as cur:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        build_index(conn, table, name, where=where, storage=storage, dimension=dimension)
+        return True
+    finally:
+        unlock(conn, name)
+
+
+def maybe_build_vector_index(conn, table, partitions=None, storage="vector", dimension=None):
+    """Cheap check on conn; when the table, or any of its `partitions`
+    ({name: predicate}), has outgrown sequential scans, the index is built
+    concurrently on a background connection"""
+    targets = partitions.items() if partitions else [(None, None)]
+    threads = []
+    for partition, where in targets:
+        if needs_vector_index(conn, table, partition, where, storage):
+            threads.append(ensure_vector_index_in_background(table, partition, where, storage=storage, dimension=dimension))
+    return threads
+
+
+def ensure_vector_index_in_background(table, partition=None, where=None, storage="vector", dimension=None):
+    """Run ensure_vector_index on its own connection without blocking the caller"""
+    def run():
+        try:
+            with psycopg.connect(VECTOR_DB_URL, autocommit=True) as conn:
+                ensure_vector_index(conn, table, partition, where, storage=storage, dimension=dimension)
+        except Exception as error:
+            print(f"Error while building vector index {index_name(table, partition, storage=storage)}: {error}")
+
+    thread = Thread(target=run, name=f"vector-index-{index_name(table, partition, storage=storage)}", daemon=True)
+    thread.start()
+    return thread
+
+
+def rebuild_vector_index(conn, table, partition=None, where=None, storage="vector", dimension=None):
+    """Build a fresh index with the current settings next to the old one,
+    then swap it in. Reads keep using the old index until the new one is
+    valid, so there is no downtime."""
+    name = index_name(table, partition, storage=storage)
+    temporary_name = f"{name}_rebuild"
+    # Indexes of the same table/partition built with another index type or storage
+    replaced = {
+        index_name(table, partition, index_type, other_storage)
+        for index_type in INDEX_TYPES
+        for other_storage in STORAGE_MODES
+    }
+
+    if not try_lock(conn, name):
+        raise RuntimeError(f"Index {name} is being built by another process")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {temporary_name}")
+        build_index(conn, table, temporary_name, where=where, storage=storage, dimension=dimension)
+
+        with conn.cursor() as cur:
+            for existing_name, _, _, _ in vector_indexes(conn, table):
+                if existing_name in replaced:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {existing_name}")
+            cur.execute(f"ALTER INDEX {temporary_name} RENAME TO {name}")
+    finally:
+        unlock(conn, name)
+
+
+def reindex_vector_indexes(conn, table):
+    """REINDEX CONCURRENTLY every ANN index of a table, keeping its parameters"""
+    with conn.cursor() as cur:
+        for name, _, _, _ in vector_indexes(conn, table):
+            start = time.perf_counter()
+            cur.execute(f"REINDEX INDEX CONCURRENTLY {name}")
+            print(f"Reindexed {name} in {time.perf_counter() - start:.1f}s")
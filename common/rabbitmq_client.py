@@ -0,0 +1,186 @@
+import pika
+import json
+import time
+from threading import Thread
+
+
+class RabbitMQClient:
+    def __init__(self, host="localhost", port=5672, user="guest", password="guest"):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.connection = None
+        self.channel = None
+        self.queues = {}
+        self.stopping = False
+
+    def connect(self, max_retries=10, retry_delay=2):
+        credentials = pika.PlainCredentials(self.user, self.password)
+        print(f"Attempting to connect to RabbitMQ at {self.host}:{self.port}")
+
+        for attempt in range(max_retries):
+            try:
+                self.connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(
+                        host=self.host,
+                        port=self.port,
+                        credentials=credentials
+                    )
+                )
+                self.channel = self.connection.channel()
+                print(f"Successfully connected to RabbitMQ at {self.host}:{self.port}")
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.ConnectionClosedByBroker) as e:
+                if attempt < max_retries - 1:
+                    wait_time = retry_delay * (2 ** attempt)
+                    print(f"Connection failed (attempt {attempt + 1}/{max_retries}): {e}")
+                    print(f"Retrying in {wait_time} seconds...")
+                    time.sleep(wait_time)
+                else:
+                    print(f"Failed to connect to RabbitMQ after {max_retries} attempts")
+                    raise
+
+    def declare_queue(self, queue_name, durable=True, dead_letter_queue=None):
+        """Declare a queue. With dead_letter_queue, rejected messages are routed
+        to that (also declared) queue instead of being dropped."""
+        if not self.channel:
+            raise Exception("Not connected to RabbitMQ. Call connect() first.")
+
+        arguments = None
+        if dead_letter_queue:
+            self.channel.queue_declare(queue=dead_letter_queue, durable=durable)
+            arguments = {
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": dead_letter_queue
+            }
+        self.channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments)
+        self.queues[queue_name] = (durable, dead_letter_queue)
+
+    def send_message(self, queue_name, message, persistent=True, headers=None):
+        if not self.channel:
+            raise Exception("Not connected to RabbitMQ. Call connect() first.")
+
+        properties = pika.BasicProperties(
+            delivery_mode=2 if persistent else None,
+            headers=headers
+        )
+
+        try:
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=queue_name,
+                body=json.dumps(message),
+                properties=properties
+            )
+        except (pika.exceptions.StreamLostError, pika.exceptions.ConnectionClosedByBroker, pika.exceptions.AMQPConnectionError) as e:
+            print(f"Connection lost, reconnecting... Error: {e}")
+            self.connect()
+            durable, dead_letter_queue = self.queues.get(queue_name, (True, None))
+            self.declare_queue(queue_name, durable=durable, dead_letter_queue=dead_letter_queue)
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=queue_name,
+                body=json.dumps(message),
+                properties=properties
+            )
+
+    def run_keeping_alive(self, callback, message):
+        """Run callback in a thread while the connection keeps answering
+        heartbeats, so long jobs do not get the consumer disconnected"""
+        outcome = {}
+
+        def target():
+            try:
+                callback(message)
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = Thread(target=target, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            self.connection.sleep(1)
+
+        if "error" in outcome:
+            raise outcome["error"]
+
+    def consume_messages(self, queue_name, callback, auto_ack=False, max_retries=None, prefetch_count=1, long_running=False, on_dead_letter=None):
+        """Consume JSON messages from a queue until stop_consuming or
+        request_stop is called.
+
+        Without max_retries, failed messages are requeued. With max_retries,
+        a failed message is republished with an incremented x-retries header
+        until it has failed max_retries times, after which it is rejected so
+        the queue's dead-letter queue receives it, and on_dead_letter, if
+        given, is called with it. With long_running, the callback runs in a
+        thread while heartbeats keep being served.
+        """
+        if not self.channel:
+            raise Exception("Not connected to RabbitMQ. Call connect() first.")
+
+        def message_callback(ch, method, properties, body):
+            message = None
+            try:
+                message = json.loads(body)
+                if long_running:
+                    self.run_keeping_alive(callback, message)
+                else:
+                    callback(message)
+                if not auto_ack:
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+            except Exception as e:
+                print(f"Error processing message: {e}")
+                if auto_ack:
+                    return
+                if max_retries is None:
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                    return
+
+                headers = dict(properties.headers or {})
+                retries = headers.get("x-retries", 0)
+                if retries < max_retries:
+                    headers["x-retries"] = retries + 1
+                    print(f"Retrying message ({retries + 1}/{max_retries})")
+                    ch.basic_publish(
+                        exchange='',
+                        routing_key=queue_name,
+                        body=body,
+                        properties=pika.BasicProperties(delivery_mode=properties.delivery_mode, headers=headers)
+                    )
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                else:
+                    print(f"Message failed {retries + 1} times, sending it to the dead-letter queue")
+                    ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                    if on_dead_letter and message is not None:
+                        try:
+                            on_dead_letter(message)
+                        except Exception as e:
+                            print(f"Error handling dead-lettered message: {e}")
+
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+        self.channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=message_callback,
+            auto_ack=auto_ack
+        )
+
+        print(f"Waiting for messages from queue '{queue_name}'. To exit press CTRL+C")
+        # Rather than start_consuming, so request_stop is noticed between
+        # messages without touching the connection from a signal handler
+        while self.channel.consumer_tags and not self.stopping:
+            self.connection.process_data_events(time_limit=1)
+        self.stop_consuming()
+
+    def request_stop(self):
+        """Make consume_messages return once the message being processed, if
+        any, is acknowledged. Only sets a flag, so it is safe to call from a
+        signal handler."""
+        self.stopping = True
+
+    def stop_consuming(self):
+        if self.channel and self.channel.is_open:
+            self.channel.stop_consuming()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
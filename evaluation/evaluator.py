@@ -1,7 +1,12 @@
 import signal
 import sys
 import os
+from pathlib import Path
 from judge import Judge
+
+# The RabbitMQ client is shared with the API
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
 from rabbitmq_client import RabbitMQClient
 import json
 from pymongo import MongoClient
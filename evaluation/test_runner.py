@@ -1,6 +1,12 @@
 import requests
 import json
+import sys
 import uuid
+from pathlib import Path
+
+# The RabbitMQ client is shared with the API
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
 from rabbitmq_client import RabbitMQClient
 
 
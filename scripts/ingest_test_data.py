@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """
 Script to ingest test data files into the vector database with evaluation flag.
-Reads all PDF files from scripts/test_data and ingests them using FileIngestion.
+Reads all PDF files from scripts/test_data and ingests them using an
+IngestionExecutor, extracting text on --workers processes while embedding and
+writing --batch-size chunks at a time.
 """
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -22,11 +25,24 @@ os.environ["EVALUATION"]="0"  # Disable evaluation mode filtering
 api_path = Path(__file__).parent.parent / "api"
 sys.path.insert(0, str(api_path))
 
-from data_processing import FileIngestion
+from connection_pools import get_vector_pool
+from ingestion_executor import IngestionExecutor, INGESTION_WORKERS
+from data_processing import INGESTION_BATCH_SIZE, initialize_vector_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest test data PDFs with the evaluation flag")
+    parser.add_argument("--workers", type=int, default=INGESTION_WORKERS, help="Extraction worker processes")
+    parser.add_argument("--batch-size", type=int, default=INGESTION_BATCH_SIZE, help="Chunks embedded and written per batch")
+    parser.add_argument("--data-dir", type=Path, default=Path(__file__).parent / "test_data", help="Directory with the PDF files")
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
+
     # Path to test data directory
-    test_data_dir = Path(__file__).parent / "test_data"
+    test_data_dir = args.data_dir
 
     if not test_data_dir.exists():
         print(f"Error: Test data directory not found at {test_data_dir}")
@@ -42,42 +58,34 @@ def main():
     print(f"Found {len(pdf_files)} PDF files to ingest")
     print("-" * 80)
 
-    # Initialize FileIngestion
+    # Initialize database tables and indexes, then the IngestionExecutor
     try:
-        file_ingestion = FileIngestion()
-        print("FileIngestion initialized successfully")
+        with get_vector_pool().connection() as conn:
+            initialize_vector_database(conn)
+        executor = IngestionExecutor(workers=args.workers, batch_size=args.batch_size)
+        print(f"IngestionExecutor initialized with {args.workers} workers and batch size {args.batch_size}")
         print("-" * 80)
     except Exception as e:
-        print(f"Error initializing FileIngestion: {e}")
+        print(f"Error initializing IngestionExecutor: {e}")
         sys.exit(1)
 
-    # Ingest each PDF file
+    # Ingest all PDF files with evaluation=True
+    try:
+        results = executor.ingest_files([(str(pdf_file), pdf_file.name, True) for pdf_file in pdf_files])
+    finally:
+        executor.shutdown()
+
     success_count = 0
     error_count = 0
 
-    for pdf_file in pdf_files:
-        try:
-            print(f"Processing: {pdf_file.name}")
-
-            # Read file as bytes
-            with open(pdf_file, 'rb') as f:
-                file_bytes = f.read()
-
-            # Ingest with evaluation=True
-            file_ingestion.ingest(
-                file_bytes=file_bytes,
-                filename=pdf_file.name,
-                evaluation=True
-            )
-
+    for result in results:
+        if result["error"] is None:
             success_count += 1
-            print(f"✓ Successfully ingested: {pdf_file.name}")
-            print("-" * 80)
-
-        except Exception as e:
+            print(f"✓ Successfully ingested: {result['filename']}")
+        else:
             error_count += 1
-            print(f"✗ Error ingesting {pdf_file.name}: {e}")
-            print("-" * 80)
+            print(f"✗ Error ingesting {result['filename']}: {result['error']}")
+    print("-" * 80)
 
     # Summary
     print("\nIngestion Summary:")